@@ -0,0 +1,229 @@
+"""
+Fyyur api.py - JSON API
+
+Collections are streamed as newline-delimited JSON straight from a
+server-side cursor, detail endpoints return a single JSON document. Every
+endpoint answers If-None-Match from a cheap version query (row count, max
+id and max updated_at) before running the real query. There is no
+Last-Modified: deletes and counter updates do not advance updated_at, so
+only the whole version, as the ETag, tells whether a copy is current. The write
+endpoints are the bulk import and the bulk soft delete.
+"""
+
+import io
+import json
+from datetime import datetime
+from hashlib import md5
+from flask import Blueprint, Response, request, jsonify, abort, stream_with_context, current_app
+from sqlalchemy import func, case
+from models import db, Venue, Artist, Show, load_with_shows, VENUE_DETAIL, ARTIST_DETAIL
+from bulk_import import import_rows, IMPORTS
+from areas import near
+from deletion import soft_delete
+from parallel import gather
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Rows fetched from the server-side cursor per round-trip
+STREAM_BATCH_SIZE = 500
+
+SOFT_DELETABLE = {'venues': Venue, 'artists': Artist}
+
+
+def table_version(model):
+    """Returns count, max id and last modification time of a table"""
+
+    return db.session.query(
+        func.count(model.id),
+        func.max(model.id),
+        func.max(model.updated_at)
+    ).one()
+
+
+def conditional(versions):
+    """Builds the ETag of version tuples and checks the request against it
+
+    Parameters
+    ----------
+    versions : list (tuple)
+        version tuples of everything the response is built from
+
+    Returns
+    -------
+    etag : String
+        entity tag covering every version
+    not_modified : Response
+        empty 304 response if the client copy is current, otherwise None
+    """
+
+    etag = md5(repr(versions).encode('utf-8')).hexdigest()
+
+    not_modified = None
+    if request.if_none_match.contains(etag):
+        not_modified = Response(status=304)
+        not_modified.set_etag(etag)
+
+    return etag, not_modified
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def _iso_start_times(shows):
+    for show in shows:
+        show['start_time'] = show['start_time'].isoformat()
+    return shows
+
+
+def stream(query, serialize, versions):
+    """Streams query results as NDJSON, or a 304 if the client copy is current"""
+
+    etag, not_modified = conditional(versions)
+    if not_modified is not None:
+        return not_modified
+
+    def generate():
+        for item in query.yield_per(STREAM_BATCH_SIZE):
+            yield json.dumps(serialize(item), default=_json_default) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.set_etag(etag)
+    return response
+
+
+@api.route('/venues')
+def venues():
+    # Streams every venue as NDJSON
+    return stream(VENUE_DETAIL.query().order_by(Venue.id), Venue.detail, [table_version(Venue)])
+
+
+@api.route('/venues/near')
+def venues_near():
+    # Venues within radius_km of lat/lng, nearest first
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius_km = request.args.get('radius_km', current_app.config['NEAR_RADIUS_KM'], type=float)
+
+    if lat is None or lng is None or not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        abort(400)
+
+    radius_km = max(0.0, min(radius_km, current_app.config['NEAR_MAX_RADIUS_KM']))
+    return jsonify(near(lat, lng, radius_km, current_app.config['NEAR_MAX_RESULTS']))
+
+
+@api.route('/artists')
+def artists():
+    # Streams every artist as NDJSON
+    return stream(ARTIST_DETAIL.query().order_by(Artist.id), Artist.detail, [table_version(Artist)])
+
+
+@api.route('/shows')
+def shows():
+    # Streams every show with its venue and artist as NDJSON
+    query = Show.listing_query().order_by(Show.start_time, Show.id)
+    versions = gather(lambda: table_version(Show),
+                      lambda: table_version(Venue),
+                      lambda: table_version(Artist))
+
+    return stream(query, Show.listing_detail, versions)
+
+
+def entity_version(model, entity_id, now):
+    """Returns the version of an entity and of the shows on its detail page
+
+    The number of upcoming shows is part of the version, so the page changes
+    once a show moves from upcoming to past.
+    """
+
+    if model is Venue:
+        counterpart, own_key, counterpart_key = Artist, Show.venue_id, Show.artist_id
+    else:
+        counterpart, own_key, counterpart_key = Venue, Show.artist_id, Show.venue_id
+
+    entity_query = db.session.query(model.id, model.updated_at). \
+        filter(model.id == entity_id)
+
+    shows_query = db.session.query(
+        func.count(Show.id),
+        func.count(case([(Show.start_time > now, Show.id)])),
+        func.max(Show.id),
+        func.max(counterpart.updated_at),
+        func.max(Show.updated_at)
+    ).join(counterpart, counterpart.id == counterpart_key). \
+        filter(own_key == entity_id, counterpart.deleted_at.is_(None))
+
+    # Both queries only depend on the id, run them together
+    entity, shows = gather(lambda: entity_query.with_session(db.session()).first(),
+                           lambda: shows_query.with_session(db.session()).one())
+
+    if entity is None:
+        abort(404)
+
+    return [tuple(entity), tuple(shows)]
+
+
+def detail(model, entity_id, show_detail, now):
+    etag, not_modified = conditional(entity_version(model, entity_id, now))
+    if not_modified is not None:
+        return not_modified
+
+    entity, past_shows, upcoming_shows = load_with_shows(model, entity_id, now)
+    if entity is None:
+        abort(404)
+
+    data = model.detail(entity)
+    data.update({
+        'past_shows': _iso_start_times([show_detail(show) for show in past_shows]),
+        'upcoming_shows': _iso_start_times([show_detail(show) for show in upcoming_shows]),
+        'past_shows_count': len(past_shows),
+        'upcoming_shows_count': len(upcoming_shows)
+    })
+
+    response = jsonify(data)
+    response.set_etag(etag)
+    return response
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    # Venue detail with its past and upcoming shows
+    return detail(Venue, venue_id, Show.artist_detail, datetime.now())
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    # Artist detail with its past and upcoming shows
+    return detail(Artist, artist_id, Show.venue_detail, datetime.now())
+
+
+@api.route('/<kind>/delete', methods=['POST'])
+def bulk_delete(kind):
+    # Soft-deletes many venues or artists in one statement, body {"ids": [...]}
+    if kind not in SOFT_DELETABLE:
+        abort(404)
+
+    body = request.get_json(silent=True) or {}
+    ids = body.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(entity_id, int) for entity_id in ids) or \
+            len(ids) > current_app.config['BULK_DELETE_MAX']:
+        abort(400)
+
+    return jsonify({'deleted': soft_delete(SOFT_DELETABLE[kind], ids)})
+
+
+@api.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    # Bulk imports artists, venues or shows from a CSV or NDJSON body
+    if kind not in IMPORTS:
+        abort(404)
+
+    fmt = 'ndjson' if request.mimetype in ('application/x-ndjson', 'application/json') else 'csv'
+    chunk_size = request.args.get('chunk_size', 1000, type=int)
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+
+    report = import_rows(kind, stream, fmt, max(1, min(chunk_size, 10000)))
+
+    return jsonify(report.summary())
@@ -9,15 +9,39 @@ Python 3.7
 # ----------------------------------------------------------------------------#
 
 import dateutil.parser
-import babel
+import click
 import logging
+import os
+from datetime import datetime, time, timedelta
+from itertools import groupby
 from sqlalchemy.exc import SQLAlchemyError
-from models import Artist, Venue, Show, setup_db
-from flask import Flask, render_template, request, flash, redirect, url_for
+from models import (Artist, Venue, Show, ShowSeries, SHOW_DEFAULT_MINUTES, setup_db, load_with_shows,
+                    ARTIST_TITLE, VENUE_DETAIL, ARTIST_DETAIL)
+from search import ranked_search
+from cache import cache
+from api import api
+from instrumentation import instrumentation
+from pool import pool_stats
+from replicas import stats as replica_stats
+from formatting import format_datetime, format_shows
+from warmup import compile_templates, warm
+import assets
+from counters import record_show, roll_over, check_drift
+from genres import members, seed_genres
+from areas import area_venues
+from scheduling import Booking, conflicts, free_slots, is_overlap_violation
+from series import SeriesError, create_series, update_series, cancel_series
+from deletion import soft_delete, purge
+from parallel import gather
+from editing import EditConflict, apply_edit, form_values
+from writequeue import QueueFull, submit, queue, drain, drain_once
+from bulk_import import import_rows, IMPORTS
+from flask import Flask, render_template, request, flash, redirect, url_for, abort, jsonify
+from jinja2 import FileSystemBytecodeCache
 from flask_moment import Moment
 from logging import Formatter, FileHandler
 
-from forms import *
+from forms import VenueForm, ArtistForm, ShowForm, ShowSeriesForm, SeriesRuleForm, Genres
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -26,21 +50,20 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 db = setup_db(app)
+cache.init_app(app)
+instrumentation.init_app(app)
+assets.init_app(app)
+app.register_blueprint(api)
+
+# Compiled templates are shared through an on-disk bytecode cache
+os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
 
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
-
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 
@@ -57,70 +80,63 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues')
 def venues():
-    # Displays venues at /venues
-    venue_list = Venue.query.group_by(Venue.city, Venue.state, Venue.id).all()
-    time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # Displays venues at /venues, grouped by city and state
+    venue_rows = Venue.areas()
     data = []
 
-    for venue in venue_list:
-        upcoming_shows = venue.shows.filter(Show.start_time > time).all()
-
+    for (city, state), rows in groupby(venue_rows, key=lambda row: (row.city, row.state)):
         data.append({
-            "city": venue.city,
-            "state": venue.state,
+            "city": city,
+            "state": state,
             "venues": [{
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": len(upcoming_shows)
-            }]
+                "id": row.id,
+                "name": row.name,
+                "num_upcoming_shows": row.num_upcoming_shows
+            } for row in rows]
         })
 
     return render_template('pages/venues.html', areas=data)
 
 
+@app.route('/venues/area/<state>/<city>')
+@cache.cached('venues')
+def venues_in_area(state, city):
+    # Displays the venues of one city/state area from the area index
+    area, rows = area_venues(state, city)
+
+    if area is None:
+        abort(404)
+
+    return render_template('pages/area.html', area=area, venues=rows)
+
+
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-    # Search on venues with partial string search. Case-insensitive.
-    venue_data = Venue.query.filter(Venue.name.ilike('%' + request.form['search_term'] + '%'))
-    venue_list = list(map(Venue.title, venue_data))
-    data = {
-        "count": len(venue_list),
-        "data": venue_list
-    }
+    # Ranked search on venue name, city, state and genres. Case-insensitive.
+    search_term = request.form.get('search_term', '')
+    data = ranked_search(Venue, search_term, request.form.get('page', 1, type=int),
+                         app.config['SEARCH_RESULTS_PER_PAGE'])
 
     return render_template('pages/search_venues.html', results=data,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
     # Shows the venue page with the given venue_id
-    venue = Venue.query.filter_by(id=venue_id).first_or_404()
-
-    past_shows = db.session.query(Artist, Show).join(Show).join(Venue). \
-        filter(
-        Show.venue_id == venue_id,
-        Show.artist_id == Artist.id,
-        Show.start_time < datetime.now()
-    ). \
-        all()
+    venue, past_shows, upcoming_shows = load_with_shows(Venue, venue_id, datetime.now())
 
-    upcoming_shows = db.session.query(Artist, Show).join(Show).join(Venue). \
-        filter(
-        Show.venue_id == venue_id,
-        Show.artist_id == Artist.id,
-        Show.start_time > datetime.now()
-    ). \
-        all()
+    if venue is None:
+        abort(404)
 
     data = Venue.detail(venue)
 
     data.update({
-        'past_shows': [Show.artist_detail(show)
-                       for artist, show in past_shows],
-        'upcoming_shows': [Show.artist_detail(show)
-                           for artist, show in upcoming_shows],
+        'past_shows': format_shows([Show.artist_detail(show) for show in past_shows]),
+        'upcoming_shows': format_shows([Show.artist_detail(show) for show in upcoming_shows]),
         'past_shows_count': len(past_shows),
         'upcoming_shows_count': len(upcoming_shows)
     })
@@ -140,82 +156,97 @@ def create_venue_form():
 def create_venue_submission():
     # Insert form data as a new Venue record in the db
     form = VenueForm()
+    if app.config['WRITE_BEHIND']:
+        busy = write_behind('venue.create', form_values(Venue, form), form.name.data,
+                            'forms/new_venue.html', form=form)
+        return busy or render_template('pages/home.html')
+
     venue = create_new(form)
     add_item(venue)
 
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    # Delete a record. Handle cases where the session commit could fail.
-    venue_data = Venue.query.get(venue_id)
-    Venue.delete(venue_data)
-    return None
+    # Soft-deletes a venue, its shows are purged later by flask purge-deleted
+    return delete_entities(Venue, [venue_id])
 
 
 @app.route('/delete_item/<int:item_id>', methods=['POST'])
 def delete_item(item_id):
-    # Handles delete button
-    venue_data = Venue.query.get(item_id)
-    Venue.delete(venue_data)
-    return render_template('pages/home.html')
+    # Handles the venue page's delete button
+    flash_deleted(Venue, item_id)
+    return redirect(url_for('index'))
+
+
+def delete_entities(model, ids):
+    """Soft-deletes venues or artists and answers with the deleted ids as JSON"""
+
+    try:
+        deleted = soft_delete(model, ids)
+    except SQLAlchemyError as e:
+        print(e)
+        db.session.rollback()
+        return jsonify({'success': False}), 500
+
+    if not deleted:
+        abort(404)
+
+    return jsonify({'success': True, 'deleted': deleted})
+
+
+def flash_deleted(model, entity_id):
+    """Soft-deletes one venue or artist and flashes the outcome"""
+
+    kind = model.__name__
+    try:
+        if soft_delete(model, [entity_id]):
+            flash('{} was successfully deleted!'.format(kind))
+        else:
+            flash('Error! {} does not exist'.format(kind))
+    except SQLAlchemyError as e:
+        print(e)
+        db.session.rollback()
+        flash('Error! {} could not be deleted'.format(kind))
 
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached('artists')
 def artists():
     # Displays artists at /artists
-    artist_data = Artist.query.all()
-
-    artist_list = [{"id": art.id, "name": art.name} for art in artist_data]
+    artist_list = ARTIST_TITLE.query().order_by(Artist.id).all()
 
     return render_template('pages/artists.html', artists=artist_list)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-    # Search on artists with partial string search. Case-insensitive
-    artist_data = Artist.query.filter(Artist.name.ilike('%' + request.form['search_term'] + '%'))
-    artist_list = list(map(Artist.title, artist_data))
-    data = {
-        "count": len(artist_list),
-        "data": artist_list
-    }
+    # Ranked search on artist name, city, state and genres. Case-insensitive
+    search_term = request.form.get('search_term', '')
+    data = ranked_search(Artist, search_term, request.form.get('page', 1, type=int),
+                         app.config['SEARCH_RESULTS_PER_PAGE'])
 
     return render_template('pages/search_artists.html', results=data,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
     # Shows the artist page with the given artist_id
-    artist = Artist.query.filter_by(id=artist_id).first_or_404()
-
-    past_shows = db.session.query(Venue, Show).join(Show).join(Artist). \
-        filter(
-        Show.artist_id == artist_id,
-        Show.venue_id == Venue.id,
-        Show.start_time < datetime.now()
-    ). \
-        all()
+    artist, past_shows, upcoming_shows = load_with_shows(Artist, artist_id, datetime.now())
 
-    upcoming_shows = db.session.query(Venue, Show).join(Show).join(Artist). \
-        filter(
-        Show.artist_id == artist_id,
-        Show.venue_id == Venue.id,
-        Show.start_time > datetime.now()
-    ). \
-        all()
+    if artist is None:
+        abort(404)
 
     data = Artist.detail(artist)
 
     data.update({
-        'past_shows': [Show.venue_detail(show)
-                       for venue, show in past_shows],
-        'upcoming_shows': [Show.venue_detail(show)
-                           for venue, show in upcoming_shows],
+        'past_shows': format_shows([Show.venue_detail(show) for show in past_shows]),
+        'upcoming_shows': format_shows([Show.venue_detail(show) for show in upcoming_shows]),
         'past_shows_count': len(past_shows),
         'upcoming_shows_count': len(upcoming_shows)
     })
@@ -223,13 +254,29 @@ def show_artist(artist_id):
     return render_template('pages/show_artist.html', artist=data)
 
 
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    # Soft-deletes an artist, their shows are purged later by flask purge-deleted
+    return delete_entities(Artist, [artist_id])
+
+
+@app.route('/artists/<int:artist_id>/delete', methods=['POST'])
+def delete_artist_submission(artist_id):
+    # Handles the artist page's delete button
+    flash_deleted(Artist, artist_id)
+    return redirect(url_for('index'))
+
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     # Populate form with fields from artist with ID <artist_id>
     form = ArtistForm()
-    artist_data = Artist.query.get(artist_id)
+    artist_data = ARTIST_DETAIL.get(artist_id)
+
+    if artist_data is None:
+        abort(404)
 
     artist_items = Artist.detail(artist_data)
     keys = ["name", "genres", "city", "state", "phone", "website", "facebook_link",
@@ -237,78 +284,101 @@ def edit_artist(artist_id):
 
     for key in keys:
         getattr(form, key).data = artist_items[key]
+    form.version.data = artist_data.version
 
     return render_template('forms/edit_artist.html', form=form, artist=artist_items)
 
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-    # Update existing artist record with ID <artist_id> using the new attributes
-    try:
-        form_items = request.form
-        artist_data = Artist.query.get(artist_id)
+    # Update existing artist record with ID <artist_id> using the changed attributes
+    return edit_submission(Artist, artist_id, ArtistForm(meta={'csrf': False}), 'show_artist')
+
 
-        keys = ["name", "genres", "city", "state", "phone", "website", "facebook_link",
-                "seeking_description", "image_link"]
+def edit_submission(model, entity_id, form, endpoint):
+    """Saves the changed fields of a venue or artist edit form
 
-        [setattr(artist_data, key, form_items[key]) for key in keys]
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model being edited
+    entity_id : int
+        row being edited
+    form : VenueForm or ArtistForm
+        submitted form, its version field holds the version it was loaded from
+    endpoint : String
+        page to redirect to once saved
 
-        seeking_venue = request.form.get('seeking_venue')
+    Returns
+    -------
+    response :
+        redirect to the page, the form again with its errors if it does not
+        validate, or the conflict page (409) if the row was edited in the
+        meantime
+    """
 
-        if seeking_venue == 'y':
-            artist_data.seeking_venue = True
-        else:
-            artist_data.seeking_venue = False
+    kind = model.__tablename__
+    if not form.validate():
+        flash('An error occurred. {} could not be updated.'.format(form.name.data or model.__name__))
+        flash_form_errors(form)
+        return render_template('forms/edit_%s.html' % kind, form=form,
+                               **{kind: {'id': entity_id, 'name': form.name.data}})
+
+    if app.config['WRITE_BEHIND']:
+        payload = {'id': entity_id, 'version': request.form.get('version', type=int),
+                   'values': form_values(model, form)}
+        busy = write_behind(kind + '.edit', payload, 'Changes to ' + form.name.data,
+                            'forms/edit_%s.html' % kind, form=form,
+                            **{kind: {'id': entity_id, 'name': form.name.data}})
+        return busy or redirect(url_for(endpoint, **{kind + '_id': entity_id}))
 
-        db.session.commit()
+    try:
+        entity, changed = apply_edit(model, entity_id, request.form.get('version', type=int),
+                                     form_values(model, form))
+    except EditConflict as conflict:
+        return render_template('pages/edit_conflict.html', entity=conflict.entity, kind=kind,
+                               differences=conflict.differences), 409
     except SQLAlchemyError as e:
+        db.session.rollback()
         print(e)
         flash('Error! Form could not be updated')
+        return redirect(url_for(endpoint, **{kind + '_id': entity_id}))
+
+    if entity is None:
+        abort(404)
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    if changed:
+        cache.invalidate(*entity.cache_groups())
+    else:
+        flash('No changes to save.')
+
+    return redirect(url_for(endpoint, **{kind + '_id': entity_id}))
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     # Populate form with fields from venue with ID <venue_id>
     form = VenueForm()
-    venue_data = Venue.query.get(venue_id)
+    venue_data = VENUE_DETAIL.get(venue_id)
+
+    if venue_data is None:
+        abort(404)
 
     venue_items = Venue.detail(venue_data)
     keys = ["name", "city", "state", "address", "phone", "image_link", "facebook_link",
-            "genres", "website", "seeking_talent", "seeking_description"]
+            "genres", "website", "seeking_talent", "seeking_description", "latitude", "longitude"]
 
     for key in keys:
         getattr(form, key).data = venue_items[key]
+    form.version.data = venue_data.version
 
     return render_template('forms/edit_venue.html', form=form, venue=venue_items)
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-    # Update existing venue record with ID <venue_id> using the new attributes
-    try:
-        form_items = request.form
-        venue_data = Venue.query.get(venue_id)
-
-        keys = ["name", "city", "state", "address", "phone", "image_link", "facebook_link",
-                "genres", "website", "seeking_description"]
-
-        [setattr(venue_data, key, form_items[key]) for key in keys]
-
-        seeking_talent = request.form.get('seeking_talent')
-
-        if seeking_talent == 'y':
-            venue_data.seeking_talent = True
-        else:
-            venue_data.seeking_talent = False
-
-        db.session.commit()
-    except SQLAlchemyError as e:
-        print(e)
-        flash('Error! Form could not be updated')
-
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    # Update existing venue record with ID <venue_id> using the changed attributes
+    return edit_submission(Venue, venue_id, VenueForm(meta={'csrf': False}), 'show_venue')
 
 
 #  Create Artist
@@ -323,23 +393,88 @@ def create_form():
 def create_artist_submission():
     # Called upon submitting the new artist listing form
     form = ArtistForm()
+    if app.config['WRITE_BEHIND']:
+        busy = write_behind('artist.create', form_values(Artist, form), form.name.data,
+                            'forms/new_artist.html', form=form)
+        return busy or render_template('pages/home.html')
+
     artist = create_new(form)
     add_item(artist)
 
     return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+def genre_page(model, genre, endpoint):
+    # Lists the venues or artists of one genre through the genre index
+    page = request.args.get('page', 1, type=int)
+    rows, has_next = members(model, genre, page, app.config['BROWSE_PER_PAGE'])
+
+    if rows is None:
+        abort(404)
+
+    return render_template('pages/genre.html', items=rows, genre=Genres[genre].value,
+                           kind=model.__tablename__, page=page, has_next=has_next,
+                           endpoint=endpoint, genre_name=genre)
+
+
+@app.route('/venues/genre/<genre>')
+@cache.cached('venues')
+def venues_by_genre(genre):
+    return genre_page(Venue, genre, 'venues_by_genre')
+
+
+@app.route('/artists/genre/<genre>')
+@cache.cached('artists')
+def artists_by_genre(genre):
+    return genre_page(Artist, genre, 'artists_by_genre')
+
+
+#  Search
+#  ----------------------------------------------------------------
+@app.route('/search', methods=['POST'])
+def search_all():
+    # Searches artists and venues together, one page of each
+    search_term = request.form.get('search_term', '')
+    page = request.form.get('page', 1, type=int)
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+
+    artists, venues = gather(lambda: ranked_search(Artist, search_term, page, per_page),
+                             lambda: ranked_search(Venue, search_term, page, per_page))
+
+    return render_template('pages/search.html', search_term=search_term,
+                           artists=artists, venues=venues)
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.cached('shows')
 def shows():
-    # Displays list of shows at /shows
-    shows_data = Show.query.all()
+    # Displays one page of shows at /shows, ordered by start time
+    limit = request.args.get('limit', app.config['SHOWS_PER_PAGE'], type=int)
+    limit = max(1, min(limit, app.config['SHOWS_MAX_PER_PAGE']))
+
+    after = None
+    after_time = request.args.get('after')
+    after_id = request.args.get('after_id', type=int)
+
+    if after_time and after_id is not None:
+        try:
+            after = (dateutil.parser.parse(after_time), after_id)
+        except (ValueError, OverflowError):
+            abort(400)
+
+    show_list, next_cursor = Show.page(after, limit)
 
-    show_list = [Show.detail(show) for show in shows_data]
+    next_url = None
+    if next_cursor is not None:
+        next_url = url_for('shows', after=next_cursor[0].isoformat(),
+                           after_id=next_cursor[1], limit=limit)
 
-    return render_template('pages/shows.html', shows=show_list)
+    return render_template('pages/shows.html', shows=format_shows(show_list), next_url=next_url)
 
 
 @app.route('/shows/create')
@@ -352,24 +487,299 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # Called to create new shows in the db, upon submitting new show listing form
+    form = ShowForm(meta={'csrf': False})
+
+    if form.validate():
+        # Soft-deleted venues and artists are filtered out like missing ones
+        if Venue.query.get(form.venue_id.data) is None:
+            form.venue_id.errors.append('Venue {} does not exist.'.format(form.venue_id.data))
+        if Artist.query.get(form.artist_id.data) is None:
+            form.artist_id.errors.append('Artist {} does not exist.'.format(form.artist_id.data))
+
+    if form.errors:
+        flash('An error occurred. Show could not be listed.')
+        flash_form_errors(form)
+        return render_template('forms/new_show.html', form=form)
+
+    booking = Booking(form.venue_id.data, form.artist_id.data, form.start_time.data,
+                      form.duration_minutes.data or SHOW_DEFAULT_MINUTES)
+
     try:
-        show = Show(
-            venue_id=request.form['venue_id'],
-            artist_id=request.form['artist_id'],
-            start_time=request.form['start_time']
-        )
+        clashes = conflicts([booking])
+        if clashes:
+            flash_conflicts(clashes)
+            return render_template('forms/new_show.html', form=form)
+
+        if app.config['WRITE_BEHIND']:
+            # The queue worker checks the booking again when it writes it
+            payload = dict(booking._asdict(), start_time=booking.start_time.isoformat())
+            busy = write_behind('show.create', payload, 'Show', 'forms/new_show.html', form=form)
+            return busy or render_template('pages/home.html')
+
+        show = Show(venue_id=booking.venue_id, artist_id=booking.artist_id,
+                    start_time=booking.start_time)
+        show.duration_minutes = booking.duration_minutes
         db.session.add(show)
+        record_show(show.venue_id, show.artist_id, show.start_time)
         db.session.commit()
+        cache.invalidate(*show.cache_groups())
 
         # On successful db insert, flash success
         flash('Show was successfully listed!')
     except SQLAlchemyError as e:
         print(e)
+        db.session.rollback()
+        if is_overlap_violation(e):
+            flash('Show could not be listed, the venue or artist was booked in the meantime.')
+            return render_template('forms/new_show.html', form=form)
         flash('An error occurred. Show could not be listed.')
 
     return render_template('pages/home.html')
 
 
+def write_behind(kind, payload, description, template, **context):
+    """Queues a create or edit for the write-behind worker
+
+    Parameters
+    ----------
+    kind : String
+        job kind, see writequeue.submit()
+    payload : dict
+        validated form data
+    description : String
+        what was submitted, for the flashed message
+    template : String
+        form template rendered again if the queue is full
+    context :
+        template variables
+
+    Returns
+    -------
+    response :
+        None once queued, a 503 with Retry-After when the queue is full
+    """
+
+    try:
+        token = submit(app, kind, payload)
+    except QueueFull:
+        flash('Too many changes are waiting to be saved, please try again in a few seconds.')
+        return render_template(template, **context), 503, \
+            {'Retry-After': str(app.config['WRITE_QUEUE_RETRY_AFTER'])}
+
+    flash('{} was received and will be saved shortly. Status: {}'.format(
+        description, url_for('write_status', token=token)))
+    return None
+
+
+@app.route('/writes/<token>')
+def write_status(token):
+    # Status of a queued write: queued (with the jobs ahead of it), running, done or failed
+    status = queue(app).status(token)
+
+    if status is None:
+        abort(404)
+
+    return jsonify(status)
+
+
+def flash_conflicts(clashes):
+    """Flashes one message per show that clashes with a booking"""
+
+    for index, kind, show in clashes:
+        flash('The {} is already booked for show {} starting {}.'.format(
+            kind, show.id, format_datetime(show.start_time, 'medium')))
+
+
+@app.route('/shows/availability')
+def show_availability():
+    # Free periods of a venue between start and end, for booking
+    venue_id = request.args.get('venue_id', type=int)
+    min_minutes = request.args.get('min_minutes', 0, type=int)
+
+    try:
+        start = dateutil.parser.parse(request.args['start'])
+        end = dateutil.parser.parse(request.args['end'])
+    except (KeyError, ValueError, OverflowError):
+        abort(400)
+
+    if venue_id is None or end <= start or \
+            end - start > timedelta(days=app.config['AVAILABILITY_MAX_DAYS']):
+        abort(400)
+
+    return jsonify({
+        'venue_id': venue_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'free': [{
+            'start': slot_start.isoformat(),
+            'end': slot_end.isoformat(),
+            'minutes': int((slot_end - slot_start).total_seconds() // 60)
+        } for slot_start, slot_end in free_slots(venue_id, start, end, max(0, min_minutes))]
+    })
+
+
+#  Show series
+#  ----------------------------------------------------------------
+def series_rule(form):
+    """Recurrence arguments of series.create_series/update_series from a form"""
+
+    return {
+        'first_start': form.start_time.data,
+        'until': datetime.combine(form.until.data, time.max),
+        'frequency': form.frequency.data,
+        'interval': form.interval.data,
+        'duration_minutes': form.duration_minutes.data,
+        'max_shows': app.config['SERIES_MAX_SHOWS']
+    }
+
+
+def flash_form_errors(form):
+    for field, errors in form.errors.items():
+        flash('{}: {}'.format(field, ', '.join(errors)))
+
+
+def series_or_404(series_id):
+    """Loads a series, aborting with 404 unless it and its venue and artist exist"""
+
+    series = ShowSeries.query.get_or_404(series_id)
+    if series.venue is None or series.artist is None:
+        # Venue or artist deleted, the series goes with the next purge
+        abort(404)
+    return series
+
+
+@app.route('/series/create', methods=['GET'])
+def create_series_form():
+    # Renders the show series form
+    return render_template('forms/new_series.html', form=ShowSeriesForm(), series=None)
+
+
+@app.route('/series/create', methods=['POST'])
+def create_series_submission():
+    # Expands a recurring series into shows and inserts them in one transaction
+    form = ShowSeriesForm(meta={'csrf': False})
+
+    if not form.validate():
+        flash('An error occurred. Series could not be listed.')
+        flash_form_errors(form)
+        return render_template('forms/new_series.html', form=form, series=None)
+
+    try:
+        series = create_series(form.venue_id.data, form.artist_id.data, **series_rule(form))
+    except SeriesError as e:
+        db.session.rollback()
+        for message in e.messages:
+            flash(message)
+        return render_template('forms/new_series.html', form=form, series=None)
+    except SQLAlchemyError as e:
+        print(e)
+        db.session.rollback()
+        flash('Show could not be listed, the venue or artist was booked in the meantime.'
+              if is_overlap_violation(e) else 'An error occurred. Series could not be listed.')
+        return render_template('forms/new_series.html', form=form, series=None)
+
+    cache.invalidate(*series.cache_groups())
+    flash('Series was successfully listed!')
+    return redirect(url_for('show_series', series_id=series.id))
+
+
+@app.route('/series/<int:series_id>')
+def show_series(series_id):
+    # Displays a series with all of its shows
+    series = series_or_404(series_id)
+
+    shows = db.session.query(Show.id, Show.start_time, Show.duration_minutes). \
+        filter(Show.series_id == series_id). \
+        order_by(Show.start_time). \
+        all()
+
+    now = datetime.now()
+    data = series.detail()
+    data.update({
+        'first_start': format_datetime(series.first_start, 'full'),
+        'until': format_datetime(series.until, 'EEEE MMMM, d, y'),
+        'shows': format_shows([{'id': show.id, 'start_time': show.start_time,
+                                'duration_minutes': show.duration_minutes,
+                                'upcoming': show.start_time > now} for show in shows])
+    })
+
+    return render_template('pages/show_series.html', series=data)
+
+
+@app.route('/series/<int:series_id>/edit', methods=['GET'])
+def edit_series(series_id):
+    # Populate the rule form with the series' current rule
+    series = series_or_404(series_id)
+    form = SeriesRuleForm(start_time=series.first_start, until=series.until.date(),
+                          frequency=series.frequency, interval=series.interval,
+                          duration_minutes=series.duration_minutes)
+
+    return render_template('forms/new_series.html', form=form, series=series.detail())
+
+
+@app.route('/series/<int:series_id>/edit', methods=['POST'])
+def edit_series_submission(series_id):
+    # Replaces the upcoming shows of the series, past shows are kept
+    series = series_or_404(series_id)
+    form = SeriesRuleForm(meta={'csrf': False})
+
+    if not form.validate():
+        flash('An error occurred. Series could not be updated.')
+        flash_form_errors(form)
+        return render_template('forms/new_series.html', form=form, series=series.detail())
+
+    try:
+        update_series(series, **series_rule(form))
+    except SeriesError as e:
+        for message in e.messages:
+            flash(message)
+        return render_template('forms/new_series.html', form=form, series=series.detail())
+    except SQLAlchemyError as e:
+        print(e)
+        db.session.rollback()
+        flash('Error! Series could not be updated')
+        return redirect(url_for('show_series', series_id=series_id))
+
+    cache.invalidate(*series.cache_groups())
+    flash('Series was successfully updated!')
+    return redirect(url_for('show_series', series_id=series_id))
+
+
+@app.route('/series/<int:series_id>/cancel', methods=['POST'])
+def cancel_series_submission(series_id):
+    # Deletes every upcoming show of the series
+    series = series_or_404(series_id)
+
+    try:
+        count = cancel_series(series)
+        cache.invalidate(*series.cache_groups())
+        flash('Series was cancelled, {} upcoming show{} removed.'.format(count, '' if count == 1 else 's'))
+    except SQLAlchemyError as e:
+        print(e)
+        db.session.rollback()
+        flash('Error! Series could not be cancelled')
+
+    return redirect(url_for('show_series', series_id=series_id))
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    # Hit, miss and invalidation counters of this worker's page cache
+    return jsonify(cache.stats())
+
+
+@app.route('/pool/stats')
+def db_pool_stats():
+    # Connection pool usage of this worker
+    return jsonify(pool_stats(db.engine))
+
+
+@app.route('/db/stats')
+def db_engine_stats():
+    # Statements run, health and pool usage of the primary and each replica, this worker
+    return jsonify(replica_stats(app))
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -412,6 +822,8 @@ def create_new(form):
         address = form.address.data
 
         venue = Venue(*results, address, seeking_talent)
+        venue.latitude = form.latitude.data
+        venue.longitude = form.longitude.data
 
         return venue
 
@@ -433,6 +845,7 @@ def add_item(obj):
     try:
         db.session.add(obj)
         db.session.commit()
+        cache.invalidate(*obj.cache_groups())
 
         # on successful db insert, flash success
         flash(request.form['name'] + ' was successfully listed!')
@@ -443,6 +856,94 @@ def add_item(obj):
         print(e)
 
 
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv')
+@click.option('--chunk-size', default=1000, show_default=True)
+def import_data(kind, source, fmt, chunk_size):
+    """Bulk import artists, venues or shows from a CSV or NDJSON file."""
+    report = import_rows(kind, source, fmt, chunk_size)
+
+    for error in report.errors:
+        click.echo('line {}: {}'.format(error['line'], error['errors']), err=True)
+
+    click.echo('{} inserted, {} failed in {:.2f}s ({:.0f} rows/sec)'.format(
+        report.inserted, report.failed, report.elapsed, report.rows_per_sec))
+
+
+@app.cli.command('precompile-templates')
+def precompile_templates():
+    """Compile every template into the bytecode cache, run at deploy time."""
+    count = compile_templates(app)
+    click.echo('{} templates compiled into {}'.format(count, app.config['JINJA_BYTECODE_CACHE_DIR']))
+
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Bundle, minify and fingerprint static files into static/dist, run at deploy time."""
+    manifest = assets.build(app.static_folder, app.static_url_path)
+    for bundle in sorted(assets.BUNDLES):
+        click.echo('{} -> {}'.format(bundle, manifest[bundle]))
+    click.echo('{} files fingerprinted'.format(len(manifest)))
+
+
+@app.cli.command('warm')
+def warm_worker():
+    """Compile templates and open pool connections, reporting the time taken."""
+    click.echo(warm(app))
+
+
+@app.cli.command('seed-genres')
+def seed_genre_table():
+    """Fill the genre lookup table from forms.Genres."""
+    seed_genres()
+    click.echo('genres seeded')
+
+
+@app.cli.command('purge-deleted')
+@click.option('--batch-size', default=None, type=int, help='Rows deleted per transaction.')
+@click.option('--older-than', default=None, type=int, help='Only purge rows deleted this many minutes ago.')
+def purge_deleted(batch_size, older_than):
+    """Hard-deletes soft-deleted venues and artists with their shows."""
+    purged = purge(batch_size or app.config['PURGE_BATCH_SIZE'],
+                   timedelta(minutes=app.config['PURGE_GRACE_MINUTES'] if older_than is None else older_than))
+    click.echo('purged {venues} venues, {artists} artists, {shows} shows'.format(**purged))
+
+
+@app.cli.command('drain-writes')
+@click.option('--once', is_flag=True, help='Apply the queued writes and exit.')
+def drain_writes(once):
+    """Apply queued write-behind submissions in batches."""
+    if not once:
+        drain(app)
+
+    total = 0
+    processed = drain_once(app)
+    while processed:
+        total += processed
+        processed = drain_once(app)
+    click.echo('applied {} queued writes'.format(total))
+
+
+@app.cli.command('rollover-shows')
+def rollover_shows():
+    """Move started shows from the upcoming to the past counters."""
+    click.echo('rolled over {}'.format(roll_over()))
+
+
+@app.cli.command('check-show-counts')
+@click.option('--fix', is_flag=True, help='Recount the rows that drifted.')
+def check_show_counts(fix):
+    """Recompute show counters from the show table and report drift."""
+    drift = check_drift(fix)
+
+    for row in drift:
+        click.echo('{table} {id}: stored {stored}, actual {actual}'.format(**row))
+
+    click.echo('{} rows drifted{}'.format(len(drift), ', fixed' if fix and drift else ''))
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
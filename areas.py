@@ -0,0 +1,206 @@
+"""
+Fyyur areas.py - City/state area index and nearby venue lookup
+
+The area table holds one row per city/state with its venue count. Every
+ORM insert, update or delete of a venue adjusts the counts in the same
+flush, remove_venues() takes soft-deleted venues out, and rebuild_areas()
+recomputes the table set-wise after Core bulk inserts. An area page reads
+its area row through the unique (state, city) index and its venues
+through ix_venue_city_state.
+
+near() finds venues within a radius through a latitude/longitude bounding
+box on ix_venue_latitude_longitude, then trims the box corners by distance.
+"""
+
+from math import asin, cos, radians, sin, sqrt
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.dialects import postgresql
+from models import db, Venue, Area
+
+# Mean Earth radius and length of one degree of latitude, in km
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+
+
+def _bump(connection, state, city, delta):
+    area = Area.__table__
+    where = and_(area.c.state == state, area.c.city == city)
+    dialect = connection.dialect.name
+
+    # An UPDATE seeing no row then an INSERT would race with the first
+    # venue of the same new area in another transaction, whose INSERT
+    # would hit the unique index and roll that venue back
+    if delta > 0 and dialect == 'postgresql':
+        statement = postgresql.insert(area).values(state=state, city=city, venue_count=delta)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[area.c.state, area.c.city],
+            set_={'venue_count': area.c.venue_count + statement.excluded.venue_count}))
+        return
+
+    if delta > 0 and dialect == 'sqlite':
+        connection.execute(area.insert().prefix_with('OR IGNORE').
+                           values(state=state, city=city, venue_count=0))
+
+    result = connection.execute(area.update().where(where).values(venue_count=area.c.venue_count + delta))
+    if result.rowcount == 0 and delta > 0:
+        connection.execute(area.insert().values(state=state, city=city, venue_count=delta))
+
+
+def _previous(history):
+    values = history.deleted or history.unchanged
+    return values[0] if values else None
+
+
+def _after_insert(mapper, connection, target):
+    _bump(connection, target.state, target.city, 1)
+
+
+def _after_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if attrs.state.history.has_changes() or attrs.city.history.has_changes():
+        _bump(connection, _previous(attrs.state.history), _previous(attrs.city.history), -1)
+        _bump(connection, target.state, target.city, 1)
+
+
+def _after_delete(mapper, connection, target):
+    # Soft-deleted venues were already taken out by remove_venues()
+    if target.deleted_at is None:
+        _bump(connection, target.state, target.city, -1)
+
+
+event.listen(Venue, 'after_insert', _after_insert)
+event.listen(Venue, 'after_update', _after_update)
+event.listen(Venue, 'after_delete', _after_delete)
+
+
+def remove_venues(ids):
+    """Takes venues out of the area counts, set-wise, before they are soft-deleted"""
+
+    counts = db.session.query(Venue.state, Venue.city, func.count(Venue.id)). \
+        filter(Venue.id.in_(ids)). \
+        group_by(Venue.state, Venue.city). \
+        all()
+
+    connection = db.session.connection()
+    for state, city, count in counts:
+        _bump(connection, state, city, -count)
+
+
+def rebuild_areas():
+    """Recomputes the area table from venue, inside the caller's transaction"""
+
+    area = Area.__table__
+    counts = select([Venue.state, Venue.city, func.count(Venue.id)]). \
+        where(and_(Venue.state.isnot(None), Venue.city.isnot(None), Venue.deleted_at.is_(None))). \
+        group_by(Venue.state, Venue.city)
+
+    db.session.execute(area.delete())
+    db.session.execute(area.insert().from_select(['state', 'city', 'venue_count'], counts))
+
+
+def area_venues(state, city):
+    """Loads one area and its venues
+
+    Parameters
+    ----------
+    state : String
+        state of the area
+    city : String
+        city of the area
+
+    Returns
+    -------
+    area : Area
+        the area row, None if no venue is in the area
+    rows : list (Row)
+        id, name and num_upcoming_shows of each venue, by name
+    """
+
+    area = db.session.query(Area). \
+        filter(Area.state == state, Area.city == city, Area.venue_count > 0). \
+        first()
+
+    if area is None:
+        return None, []
+
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(Venue.city == city, Venue.state == state). \
+        order_by(Venue.name, Venue.id). \
+        all()
+
+    return area, rows
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points, haversine formula"""
+
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """Returns (min lat, max lat, min lng, max lng) of a box around a circle"""
+
+    delta_lat = radius_km / KM_PER_DEGREE
+    # Longitude degrees shrink towards the poles, near them take every longitude
+    shrink = cos(radians(lat))
+    delta_lng = radius_km / (KM_PER_DEGREE * shrink) if shrink > 1e-6 else 180.0
+
+    if abs(lat) + delta_lat >= 90 or delta_lng >= 180:
+        return max(-90.0, lat - delta_lat), min(90.0, lat + delta_lat), -180.0, 180.0
+    return lat - delta_lat, lat + delta_lat, lng - delta_lng, lng + delta_lng
+
+
+def near(lat, lng, radius_km, limit=50):
+    """Lists the venues within radius_km of a point, nearest first
+
+    Parameters
+    ----------
+    lat : float
+        latitude of the point, degrees
+    lng : float
+        longitude of the point, degrees
+    radius_km : float
+        search radius
+    limit : int
+        maximum number of venues returned
+
+    Returns
+    -------
+    venues : list (dict)
+        id, name, city, state, latitude, longitude and distance_km of each venue
+    """
+
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    longitudes = Venue.longitude.between(min_lng, max_lng)
+
+    # Boxes crossing the antimeridian wrap around to the other side
+    if min_lng < -180:
+        longitudes = (Venue.longitude >= min_lng + 360) | (Venue.longitude <= max_lng)
+    elif max_lng > 180:
+        longitudes = (Venue.longitude >= min_lng) | (Venue.longitude <= max_lng - 360)
+
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.latitude,
+        Venue.longitude
+    ).filter(Venue.latitude.between(min_lat, max_lat), longitudes). \
+        all()
+
+    venues = []
+    for row in rows:
+        distance = distance_km(lat, lng, row.latitude, row.longitude)
+        if distance <= radius_km:
+            venue = row._asdict()
+            venue['distance_km'] = round(distance, 3)
+            venues.append(venue)
+
+    venues.sort(key=lambda venue: venue['distance_km'])
+    return venues[:limit]
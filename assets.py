@@ -0,0 +1,254 @@
+"""
+Fyyur assets.py - Static asset bundling, fingerprinting and serving
+
+`flask build-assets` writes every file under static/ to static/dist/ with
+a content hash in its name, concatenates and minifies the BUNDLES, points
+their CSS url() references at the hashed files, and stores gzip and, when
+the brotli package is installed, brotli copies of the compressible ones.
+static/dist/manifest.json maps each logical name (css/app.css,
+fonts/FontAwesome.otf, ...) to its hashed file.
+
+Templates link assets through asset_url() and bundle_urls(). With
+ASSETS_BUNDLED on they resolve to the hashed files, otherwise to the
+sources, so nothing needs building during development. Hashed files never
+change, so they are served with a one-year immutable Cache-Control, and
+from the precompressed copy the client accepts.
+
+    flask build-assets            # at deploy time, next to precompile-templates
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import current_app, request, send_from_directory, url_for
+
+# Directory under static/ the build writes to
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Bundle name -> source files, in load order
+BUNDLES = {
+    'css/app.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                    'css/main.responsive.css', 'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'js/app.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js']
+}
+
+# Extensions worth storing precompressed; fonts like woff and images already are
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.json', '.ttf', '.otf', '.eot'}
+
+ONE_YEAR = 365 * 24 * 3600
+IMMUTABLE = 'public, max-age={}, immutable'.format(ONE_YEAR)
+
+# Strings and comments, which the CSS minifier must not look inside
+CSS_TOKEN = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def minify_css(css):
+    """Drops comments (but /*! licences) and the whitespace CSS does not need"""
+
+    def squeeze(text):
+        return CSS_PUNCTUATION.sub(r'\1', re.sub(r'\s+', ' ', text))
+
+    kept = []
+    text = ''
+    for i, part in enumerate(CSS_TOKEN.split(css)):
+        if i % 2 == 0:
+            text += part
+        elif part.startswith('/*') and not part.startswith('/*!'):
+            # A comment separates tokens like whitespace does
+            text += ' '
+        else:
+            kept += [squeeze(text), part]
+            text = ''
+    kept.append(squeeze(text))
+
+    return ''.join(kept).replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """Minifies JavaScript with rjsmin when installed
+
+    Without it only indentation, blank lines and whole-line // comments go,
+    which is safe for any script without template literals or line
+    continuations, and those are left alone.
+    """
+
+    try:
+        import rjsmin
+    except ImportError:
+        rjsmin = None
+
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    if '`' in source or '\\\n' in source:
+        return source
+
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def _hashed_name(name, content):
+    digest = hashlib.md5(content).hexdigest()[:10]
+    root, ext = posixpath.splitext(name)
+    return posixpath.join(DIST, '{}.{}{}'.format(root, digest, ext))
+
+
+def _write(static_folder, name, content):
+    path = os.path.join(static_folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    if posixpath.splitext(name)[1] not in COMPRESSIBLE:
+        return
+
+    compressed = {'.gz': gzip.compress(content, 9, mtime=0)}
+    try:
+        import brotli
+        compressed['.br'] = brotli.compress(content)
+    except ImportError:
+        pass
+
+    for suffix, data in compressed.items():
+        # Only keep the copies that are actually smaller
+        if len(data) < len(content):
+            with open(path + suffix, 'wb') as f:
+                f.write(data)
+
+
+def _rewrite_urls(css, source, manifest, static_url_path):
+    """Points the relative url()s of a CSS source at the hashed files"""
+
+    def rewrite(match):
+        quote, ref = match.groups()
+        if re.match(r'(data:|[a-z]+:|//|/|#)', ref):
+            return match.group(0)
+
+        path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        target = manifest.get(name, name)
+        return 'url({0}{1}/{2}{3}{0})'.format(quote, static_url_path, target, suffix)
+
+    return CSS_URL.sub(rewrite, css)
+
+
+def build(static_folder, static_url_path='/static'):
+    """Fingerprints every static file and builds the bundles
+
+    Parameters
+    ----------
+    static_folder : String
+        the app's static directory
+    static_url_path : String
+        URL prefix of the static route, for the rewritten CSS url()s
+
+    Returns
+    -------
+    manifest : dict
+        logical name -> hashed path under static_folder
+    """
+
+    manifest = {}
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        relative = os.path.relpath(root, static_folder).replace(os.sep, '/')
+        if relative == DIST or relative.startswith(DIST + '/'):
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(name for name in dirs if not (relative == '.' and name == DIST))
+        sources.extend(posixpath.normpath(posixpath.join(relative, name))
+                       for name in sorted(files) if not name.startswith('.'))
+
+    for name in sources:
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            content = f.read()
+        manifest[name] = _hashed_name(name, content)
+        _write(static_folder, manifest[name], content)
+
+    for bundle, files in BUNDLES.items():
+        texts = []
+        for name in files:
+            with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+                text = f.read()
+            if bundle.endswith('.css'):
+                texts.append(minify_css(_rewrite_urls(text, name, manifest, static_url_path)))
+            else:
+                texts.append(text if name.endswith('.min.js') else minify_js(text))
+
+        # A newline and semicolon keep one script's last statement from running into the next
+        content = ('\n' if bundle.endswith('.css') else '\n;').join(texts).encode('utf-8')
+        manifest[bundle] = _hashed_name(bundle, content)
+        _write(static_folder, manifest[bundle], content)
+
+    with open(os.path.join(static_folder, DIST, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Reads the manifest written by build(), empty if there is none"""
+
+    path = os.path.join(static_folder, DIST, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def asset_url(filename):
+    """url_for('static', filename=...) resolving to the hashed file when bundled"""
+
+    manifest = current_app.extensions['assets']
+    return url_for('static', filename=manifest.get(filename, filename))
+
+
+def bundle_urls(name):
+    """URLs to link for a bundle: the built file, or its sources when not bundled"""
+
+    manifest = current_app.extensions['assets']
+    if name in manifest:
+        return [url_for('static', filename=manifest[name])]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+def send_static(filename):
+    """Static route serving hashed files for a year, precompressed when accepted"""
+
+    app = current_app
+    if not filename.startswith(DIST + '/'):
+        return app.send_static_file(filename)
+
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and \
+                os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix,
+                                           mimetype=mimetype, cache_timeout=ONE_YEAR)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(app.static_folder, filename, cache_timeout=ONE_YEAR)
+
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Loads the manifest, registers the template helpers and the static view"""
+
+    bundled = app.config.get('ASSETS_BUNDLED', False)
+    app.extensions['assets'] = load_manifest(app.static_folder) if bundled else {}
+    if bundled and not app.extensions['assets']:
+        app.logger.warning('ASSETS_BUNDLED is on but %s has no manifest, '
+                           'run flask build-assets', os.path.join(app.static_folder, DIST))
+
+    app.jinja_env.globals.update(asset_url=asset_url, bundle_urls=bundle_urls)
+    app.view_functions['static'] = send_static
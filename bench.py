@@ -0,0 +1,364 @@
+"""
+Fyyur bench.py - Route benchmarks against a synthetic dataset
+
+Seeds a throwaway database with N venues, M artists and K shows, drives
+every route through the Flask test client and reports p50/p95/p99 latency,
+queries per request and rows fetched. Results can be saved as a baseline;
+later runs fail when a route's p95 or query count regresses past it.
+
+    python bench.py --venues 500 --artists 500 --shows 20000 --save-baseline
+    python bench.py --venues 500 --artists 500 --shows 20000
+    python bench.py --formatting 10000
+    python bench.py --parallel-reads --baseline bench_baseline.json
+
+The database given with --database is dropped and recreated. Rows fetched
+are counted as results are read, so they are reported on every backend.
+
+A plain run compares against bench_baseline.json, committed from the
+default SQLite settings above. Latency depends on the machine, so record
+the baseline again with --save-baseline on the machine that runs the
+comparison (and commit it) before relying on the p95 check there.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import ResultProxy
+
+DEFAULT_DATABASE = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_bench.db')
+# Fewest timed requests per route whose p95 is compared with the baseline
+MIN_P95_SAMPLES = 20
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help='throwaway database URL, dropped and reseeded')
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=730,
+                        help='shows are spread over this many days around today')
+    parser.add_argument('--requests', type=int, default=50,
+                        help='timed requests per route')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cache', action='store_true',
+                        help='leave the page cache on (off by default)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative p95 slowdown before a route fails')
+    parser.add_argument('--formatting', type=int, metavar='N',
+                        help='only time formatting N show start times, old vs new path')
+    parser.add_argument('--parallel-reads', action='store_true',
+                        help='run independent read queries concurrently (PARALLEL_READS)')
+    parser.add_argument('--slack-ms', type=float, default=2.0,
+                        help='absolute p95 slowdown always allowed, absorbs timer noise')
+    return parser.parse_args(argv)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def seed(db, models, genres, states, n_venues, n_artists, n_shows, days, rng):
+    """Drops and refills every table with synthetic rows using bulk inserts"""
+
+    Venue, Artist, Show = models
+    db.drop_all()
+    db.create_all()
+
+    cities = ['City %d' % i for i in range(max(1, n_venues // 10))]
+
+    def entity(kind, i):
+        return {
+            'name': '%s %d %s' % (kind, i, rng.choice(genres)),
+            'city': rng.choice(cities),
+            'state': rng.choice(states),
+            'phone': '555-%04d' % i,
+            'image_link': 'https://example.com/%s/%d.jpg' % (kind.lower(), i),
+            'facebook_link': 'https://facebook.com/%s%d' % (kind.lower(), i),
+            'genres': rng.sample(genres, rng.randint(1, 3)),
+            'website': 'https://example.com/%s/%d' % (kind.lower(), i),
+            'seeking_description': ''
+        }
+
+    venues = []
+    for i in range(n_venues):
+        row = entity('Venue', i)
+        row.update(address='%d Main St' % i, seeking_talent=rng.random() < 0.5,
+                   latitude=rng.uniform(25, 49), longitude=rng.uniform(-124, -67))
+        venues.append(row)
+
+    artists = []
+    for i in range(n_artists):
+        row = entity('Artist', i)
+        row.update(seeking_venue=rng.random() < 0.5)
+        artists.append(row)
+
+    # Every show gets its own two hour slot, so none of them overlap
+    start = datetime.now() - timedelta(days=days // 2)
+    shows = [{
+        'venue_id': rng.randint(1, n_venues),
+        'artist_id': rng.randint(1, n_artists),
+        'start_time': start + timedelta(hours=2 * slot),
+        'duration_minutes': 120
+    } for slot in rng.sample(range(days * 12), n_shows)]
+
+    for model, rows in ((Venue, venues), (Artist, artists), (Show, shows)):
+        for offset in range(0, len(rows), 5000):
+            db.session.execute(model.__table__.insert(), rows[offset:offset + 5000])
+    db.session.commit()
+
+
+def routes(n_venues, n_artists, rng):
+    """Lists (name, method, url factory, form data or its factory) for every route"""
+
+    venue = lambda: rng.randint(1, n_venues)
+    artist = lambda: rng.randint(1, n_artists)
+    edit_venue = {'name': 'Edited', 'city': 'City 0', 'state': 'NY', 'address': '1 Main St',
+                  'phone': '555', 'image_link': '', 'facebook_link': 'https://facebook.com/x',
+                  'genres': 'Jazz', 'website': 'https://example.com', 'seeking_description': ''}
+    edit_artist = dict(edit_venue)
+    del edit_artist['address']
+    edits = {'venues': 0, 'artists': 0}
+
+    def edit(kind, body):
+        # Renames row 1 on every request, sending the version the last edit left it at
+        def data():
+            edits[kind] += 1
+            return dict(body, name='Edited %d' % edits[kind], version=str(edits[kind]))
+        return data
+
+    return [
+        ('index', 'GET', lambda: '/', None),
+        ('venues', 'GET', lambda: '/venues', None),
+        ('show_venue', 'GET', lambda: '/venues/%d' % venue(), None),
+        ('artists', 'GET', lambda: '/artists', None),
+        ('show_artist', 'GET', lambda: '/artists/%d' % artist(), None),
+        ('shows', 'GET', lambda: '/shows', None),
+        ('venues_by_genre', 'GET', lambda: '/venues/genre/Jazz', None),
+        ('artists_by_genre', 'GET', lambda: '/artists/genre/Rock_n_Roll', None),
+        ('search_venues', 'POST', lambda: '/venues/search', {'search_term': 'venue 1'}),
+        ('search_artists', 'POST', lambda: '/artists/search', {'search_term': 'jazz'}),
+        ('search_all', 'POST', lambda: '/search', {'search_term': 'rock'}),
+        ('create_venue_form', 'GET', lambda: '/venues/create', None),
+        ('create_form', 'GET', lambda: '/artists/create', None),
+        ('create_shows', 'GET', lambda: '/shows/create', None),
+        ('show_availability', 'GET', lambda: '/shows/availability?venue_id=%d&start=%s&end=%s' % (
+            venue(), datetime.now().date(), datetime.now().date() + timedelta(days=30)), None),
+        ('edit_venue', 'GET', lambda: '/venues/%d/edit' % venue(), None),
+        ('edit_artist', 'GET', lambda: '/artists/%d/edit' % artist(), None),
+        ('api.venues', 'GET', lambda: '/api/v1/venues', None),
+        ('api.venues_near', 'GET', lambda: '/api/v1/venues/near?lat=%.3f&lng=%.3f&radius_km=200' % (
+            rng.uniform(25, 49), rng.uniform(-124, -67)), None),
+        ('api.artists', 'GET', lambda: '/api/v1/artists', None),
+        ('api.shows', 'GET', lambda: '/api/v1/shows', None),
+        ('api.venue', 'GET', lambda: '/api/v1/venues/%d' % venue(), None),
+        ('api.artist', 'GET', lambda: '/api/v1/artists/%d' % artist(), None),
+        ('edit_venue_submission', 'POST', lambda: '/venues/1/edit', edit('venues', edit_venue)),
+        ('edit_artist_submission', 'POST', lambda: '/artists/1/edit', edit('artists', edit_artist)),
+        # A new booking per request, a repeated one would only time the conflict check
+        ('create_show_submission', 'POST', lambda: '/shows/create',
+         lambda: {'venue_id': str(venue()), 'artist_id': str(artist()),
+                  'start_time': (datetime.now() + timedelta(days=rng.randint(1, 300))).strftime('%Y-%m-%d %H:%M:%S')}),
+    ]
+
+
+class QueryCounter:
+    """Counts statements run on an engine and the rows read from their results"""
+
+    def __init__(self, engine):
+        self.queries = 0
+        self.rows = 0
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+        # Every fetch of a result, ORM loads included, goes through process_rows
+        process_rows = ResultProxy.process_rows
+
+        def counting_process_rows(result, rows):
+            processed = process_rows(result, rows)
+            self.rows += len(processed)
+            return processed
+
+        ResultProxy.process_rows = counting_process_rows
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+
+    def reset(self):
+        self.queries = 0
+        self.rows = 0
+
+
+def run(args):
+    os.environ['DATABASE_URL'] = args.database
+    if not args.cache:
+        os.environ['CACHE_TYPE'] = 'null'
+
+    import app as fyyur
+    from models import db, Venue, Artist, Show
+    from forms import Genres, states
+    from counters import recount
+    from genres import seed_genres, sync_genres
+    from areas import rebuild_areas
+
+    fyyur.app.config['WTF_CSRF_ENABLED'] = False
+    fyyur.app.config['PARALLEL_READS'] = args.parallel_reads
+    rng = random.Random(args.seed)
+
+    with fyyur.app.app_context():
+        started = time.perf_counter()
+        seed(db, (Venue, Artist, Show), [genre.name for genre in Genres],
+             [state for state, label in states], args.venues, args.artists, args.shows,
+             args.days, rng)
+        recount(Venue)
+        recount(Artist)
+        seed_genres()
+        sync_genres(Venue)
+        sync_genres(Artist)
+        rebuild_areas()
+        db.session.commit()
+        print('seeded {} venues, {} artists, {} shows in {:.1f}s'.format(
+            args.venues, args.artists, args.shows, time.perf_counter() - started))
+        counter = QueryCounter(db.engine)
+        db.session.remove()
+
+    client = fyyur.app.test_client()
+    results = {}
+
+    for name, method, url, data in routes(args.venues, args.artists, rng):
+        timings = []
+        queries = []
+        rows = []
+
+        # one untimed request warms templates and the connection pool
+        client.open(url(), method=method, data=data() if callable(data) else data)
+
+        for i in range(args.requests):
+            body = data() if callable(data) else data
+            counter.reset()
+            # Collect between requests rather than in one, like timeit, so
+            # collector pauses do not land in the percentiles
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                response = client.open(url(), method=method, data=body)
+                response.get_data()
+                timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                gc.enable()
+            queries.append(counter.queries)
+            rows.append(counter.rows)
+
+            if response.status_code >= 500:
+                print('{} returned {}'.format(name, response.status_code), file=sys.stderr)
+                break
+
+        results[name] = {
+            'samples': len(timings),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': max(queries),
+            'rows': max(rows)
+        }
+
+    return results
+
+
+def report(results, baseline, tolerance, slack_ms):
+    """Prints results next to the baseline and returns the regressed routes"""
+
+    regressions = []
+    print('{:<24} {:>9} {:>9} {:>9} {:>8} {:>8}  {}'.format(
+        'route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'rows', 'baseline p95/queries'))
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        note = ''
+        if base:
+            note = '{:.3f} / {}'.format(base['p95_ms'], base['queries'])
+            # With a handful of requests p95 is just the slowest one, only compare queries
+            timed = result['samples'] >= MIN_P95_SAMPLES
+            if timed and result['p95_ms'] > base['p95_ms'] * (1 + tolerance) + slack_ms or \
+                    result['queries'] > base['queries']:
+                regressions.append(name)
+                note += '  REGRESSED'
+            elif not timed:
+                note += '  (p95 not compared, under {} requests)'.format(MIN_P95_SAMPLES)
+
+        print('{:<24} {:>9.3f} {:>9.3f} {:>9.3f} {:>8} {:>8}  {}'.format(
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries'],
+            result['rows'], note))
+
+    return regressions
+
+
+def formatting_benchmark(n):
+    """Times per-show start time formatting, re-parse path vs batched path"""
+
+    import babel.dates
+    import dateutil.parser
+    from formatting import format_many, PATTERNS
+
+    start = datetime(2021, 1, 1, 20, 0)
+    values = [start + timedelta(hours=i) for i in range(n)]
+
+    def reparse(value):
+        return babel.dates.format_datetime(dateutil.parser.parse(str(value)), PATTERNS['full'])
+
+    started = time.perf_counter()
+    old = [reparse(value) for value in values]
+    old_us = (time.perf_counter() - started) * 1e6 / n
+
+    started = time.perf_counter()
+    new = format_many(values, 'full')
+    new_us = (time.perf_counter() - started) * 1e6 / n
+
+    assert old == new
+    print('{} shows: str+parse+format_datetime {:.1f} us/show, format_many {:.1f} us/show'.format(
+        n, old_us, new_us))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.formatting:
+        formatting_benchmark(args.formatting)
+        return 0
+
+    results = run(args)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = report(results, baseline, args.tolerance, args.slack_ms)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('baseline saved to ' + args.baseline)
+    elif regressions:
+        print('regressed: ' + ', '.join(regressions), file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Fyyur bulk_import.py - Chunked CSV/NDJSON import of artists, venues and shows
+
+Rows are validated with the same form classes as the create pages, then
+written a chunk at a time: PostgreSQL COPY when available, otherwise one
+executemany insert per chunk. Each chunk is its own transaction, and rows
+that fail are reported individually without aborting the import.
+"""
+
+import csv
+import io
+import json
+import time
+from itertools import islice
+from werkzeug.datastructures import MultiDict
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Venue, Artist, Show, SHOW_DEFAULT_MINUTES
+from forms import VenueForm, ArtistForm, ShowForm
+from search import INDEXES
+from cache import cache
+from counters import recount_shows
+from genres import sync_genres
+from scheduling import Booking, conflicts, overlapping_bookings
+from areas import rebuild_areas
+
+IMPORTS = {
+    'venues': (Venue, VenueForm, ["name", "city", "state", "address", "phone", "image_link",
+                                  "facebook_link", "genres", "website", "seeking_talent",
+                                  "seeking_description", "latitude", "longitude"]),
+    'artists': (Artist, ArtistForm, ["name", "city", "state", "phone", "genres", "image_link",
+                                     "facebook_link", "website", "seeking_venue",
+                                     "seeking_description"]),
+    'shows': (Show, ShowForm, ["artist_id", "venue_id", "start_time", "duration_minutes"])
+}
+
+BOOLEAN_FIELDS = {"seeking_talent", "seeking_venue"}
+TRUE_VALUES = {"1", "true", "t", "y", "yes", "on"}
+
+
+class ImportReport:
+    """Counts and per-row errors of one import run"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, messages):
+        self.failed += 1
+        self.errors.append({'line': line, 'errors': messages})
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_sec(self):
+        processed = self.inserted + self.failed
+        return processed / self.elapsed if self.elapsed else 0.0
+
+    def summary(self, max_errors=1000):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors[:max_errors],
+            'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1)
+        }
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, row dict) from a CSV or NDJSON text stream
+
+    Parameters
+    ----------
+    stream : file object
+        text stream to read from
+    fmt : String
+        'csv' (header row required) or 'ndjson'
+    """
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+    else:
+        raise ValueError('Unknown import format: ' + fmt)
+
+
+def to_formdata(row):
+    """Converts an imported row into form data for the create forms"""
+
+    formdata = MultiDict()
+
+    for key, value in row.items():
+        if value is None:
+            continue
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [genre.strip() for genre in value.replace(';', ',').split(',')]
+            for genre in value:
+                if genre:
+                    formdata.add(key, genre)
+        elif key in BOOLEAN_FIELDS:
+            if str(value).strip().lower() in TRUE_VALUES:
+                formdata.add(key, 'y')
+        else:
+            formdata.add(key, str(value))
+
+    return formdata
+
+
+def validate_row(form_class, fields, row):
+    """Validates a row with a create form
+
+    Returns
+    -------
+    mapping : dict
+        column values for the insert, None if the row is invalid
+    errors : dict
+        form errors by field
+    """
+
+    if not isinstance(row, dict):
+        return None, {'row': [str(row)]}
+
+    form = form_class(formdata=to_formdata(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+
+    return {key: getattr(form, key).data for key in fields}, {}
+
+
+def _check_show_references(batch, report):
+    """Drops shows whose artist or venue does not exist, set-wise per chunk"""
+
+    numeric = []
+    for line, mapping in batch:
+        try:
+            mapping['artist_id'] = int(mapping['artist_id'])
+            mapping['venue_id'] = int(mapping['venue_id'])
+        except (TypeError, ValueError):
+            report.error(line, {'row': ['artist_id and venue_id must be integers']})
+        else:
+            mapping['duration_minutes'] = mapping['duration_minutes'] or SHOW_DEFAULT_MINUTES
+            numeric.append((line, mapping))
+
+    artist_ids = {mapping['artist_id'] for line, mapping in numeric}
+    venue_ids = {mapping['venue_id'] for line, mapping in numeric}
+
+    known_artists = {row[0] for row in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    known_venues = {row[0] for row in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+
+    valid = []
+    for line, mapping in numeric:
+        errors = {}
+        if mapping['artist_id'] not in known_artists:
+            errors['artist_id'] = ['Unknown artist']
+        if mapping['venue_id'] not in known_venues:
+            errors['venue_id'] = ['Unknown venue']
+        if errors:
+            report.error(line, errors)
+        else:
+            valid.append((line, mapping))
+
+    return valid
+
+
+def _check_show_conflicts(batch, report):
+    """Drops shows overlapping an existing show or an earlier row of the chunk
+
+    One query and one interval tree lookup per row for the whole chunk, the
+    exclusion constraints on PostgreSQL still catch concurrent writers.
+    """
+
+    bookings = [Booking(mapping['venue_id'], mapping['artist_id'], mapping['start_time'],
+                        mapping['duration_minutes']) for line, mapping in batch]
+
+    rejected = {}
+    for index, kind, show in conflicts(bookings):
+        rejected.setdefault(index, []).append('The {} is already booked for show {}'.format(kind, show.id))
+    for first, second, kind in overlapping_bookings(bookings):
+        rejected.setdefault(second, []).append('Overlaps line {} at the same {}'.format(batch[first][0], kind))
+
+    valid = []
+    for index, (line, mapping) in enumerate(batch):
+        if index in rejected:
+            report.error(line, {'start_time': rejected[index]})
+        else:
+            valid.append((line, mapping))
+
+    return valid
+
+
+def _pg_array(values):
+    return '{' + ','.join('"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+                          for value in values) + '}'
+
+
+def copy_rows(table, fields, mappings):
+    """Writes rows with PostgreSQL COPY on the session's connection"""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for mapping in mappings:
+        row = []
+        for key in fields:
+            value = mapping[key]
+            if isinstance(value, (list, tuple)):
+                value = _pg_array(value)
+            elif value is None:
+                value = r'\N'
+            row.append(value)
+        writer.writerow(row)
+
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+            table.name, ', '.join(fields)),
+        buffer
+    )
+
+
+def write_chunk(model, fields, batch, report, use_copy):
+    """Inserts one validated chunk in a single transaction
+
+    If the chunk fails as a whole, its rows are retried one savepoint at a
+    time so only the offending rows are reported.
+
+    Returns
+    -------
+    inserted : list (dict)
+        mappings of the rows actually written
+    """
+
+    mappings = [mapping for line, mapping in batch]
+    errors = (SQLAlchemyError, db.engine.dialect.dbapi.Error)
+
+    try:
+        if use_copy:
+            copy_rows(model.__table__, fields, mappings)
+        else:
+            db.session.execute(model.__table__.insert(), mappings)
+        db.session.commit()
+        report.inserted += len(batch)
+        return mappings
+    except errors:
+        db.session.rollback()
+
+    inserted = []
+    for line, mapping in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(model.__table__.insert(), [mapping])
+            inserted.append(mapping)
+        except SQLAlchemyError as e:
+            report.error(line, {'row': [str(e.orig if hasattr(e, 'orig') else e)]})
+    db.session.commit()
+    report.inserted += len(inserted)
+    return inserted
+
+
+def import_rows(kind, stream, fmt='csv', chunk_size=1000):
+    """Imports artists, venues or shows from a CSV or NDJSON stream
+
+    Parameters
+    ----------
+    kind : String
+        'artists', 'venues' or 'shows'
+    stream : file object
+        text stream holding the rows
+    fmt : String
+        'csv' or 'ndjson'
+    chunk_size : int
+        rows written per transaction
+
+    Returns
+    -------
+    report : ImportReport
+        inserted and failed counts, per-row errors and throughput
+    """
+
+    model, form_class, fields = IMPORTS[kind]
+    use_copy = db.engine.dialect.name == 'postgresql'
+    report = ImportReport()
+    rows = read_rows(stream, fmt)
+    last_id = db.session.query(func.max(model.id)).scalar() or 0
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        batch = []
+        for line, row in chunk:
+            mapping, errors = validate_row(form_class, fields, row)
+            if errors:
+                report.error(line, errors)
+            else:
+                batch.append((line, mapping))
+
+        if model is Show and batch:
+            batch = _check_show_references(batch, report)
+            batch = _check_show_conflicts(batch, report)
+
+        if batch:
+            inserted = write_chunk(model, fields, batch, report, use_copy)
+
+            if model is Show and inserted:
+                recount_shows(inserted)
+                db.session.commit()
+
+    # Core inserts bypass the mapper events that keep these in sync
+    if model is not Show:
+        sync_genres(model, [row[0] for row in db.session.query(model.id).filter(model.id > last_id)])
+        if model is Venue:
+            rebuild_areas()
+        db.session.commit()
+    for index in INDEXES.values():
+        index.invalidate()
+    cache.clear()
+
+    return report.finish()
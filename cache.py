@@ -0,0 +1,206 @@
+"""
+Fyyur cache.py - Rendered page cache for the read-only routes
+
+Pages are stored under a group (e.g. 'venues' or 'venue:3') and a variant
+(the request's path and query string), so a write can drop every cached variant of
+the pages it affects with one invalidate() call.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, session, make_response
+
+
+class LRUBackend:
+    """In-process cache bounded by entry count, entries expire after a TTL"""
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def get(self, group, variant):
+        key = (group, variant)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, group, variant, value, timeout):
+        key = (group, variant)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            self.groups.setdefault(group, set()).add(variant)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, group):
+        with self.lock:
+            for variant in self.groups.pop(group, ()):
+                self.entries.pop((group, variant), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+
+    def size(self):
+        return len(self.entries)
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        variants = self.groups.get(key[0])
+        if variants is not None:
+            variants.discard(key[1])
+            if not variants:
+                del self.groups[key[0]]
+
+
+class RedisBackend:
+    """Cache shared between workers, one Redis hash per group
+
+    Any client exposing redis-py's hget/hset/expire/delete/flushdb can be
+    passed in, which lets a local stand-in replace the Redis server.
+    """
+
+    def __init__(self, client, prefix='fyyur:page:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, group, variant):
+        value = self.client.hget(self.prefix + group, variant)
+        if value is None:
+            return None
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, group, variant, value, timeout):
+        key = self.prefix + group
+        self.client.hset(key, variant, value)
+        self.client.expire(key, int(timeout))
+
+    def delete(self, group):
+        self.client.delete(self.prefix + group)
+
+    def clear(self):
+        self.client.flushdb()
+
+    def size(self):
+        return None
+
+
+class ResponseCache:
+    """Caches rendered pages for views wrapped with cached()
+
+    Configured from the app config:
+
+    CACHE_TYPE : 'simple' (in-process LRU), 'redis' or 'null' (disabled)
+    CACHE_DEFAULT_TIMEOUT : seconds a page stays cached
+    CACHE_MAX_ENTRIES : size bound of the in-process LRU
+    CACHE_REDIS_URL : server used when CACHE_TYPE is 'redis'
+    REPLICA_CACHE_TIMEOUT : seconds a page read from a replica stays cached,
+        it may predate a write the replica has not replayed yet
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.timeout = 300
+        self.replica_timeout = 300
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'simple')
+        self.timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        self.replica_timeout = min(self.timeout, app.config.get('REPLICA_CACHE_TIMEOUT', self.timeout))
+
+        if self.backend is not None or cache_type == 'null':
+            pass
+        elif cache_type == 'redis':
+            import redis
+            self.backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+        else:
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 500))
+
+    def cached(self, group):
+        """Decorates a view so its rendered page is served from the cache
+
+        Parameters
+        ----------
+        group : String
+            cache group of the page, formatted with the view's arguments,
+            e.g. 'venue:{venue_id}'
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages rendered with pending flash messages are user specific
+                if self.backend is None or '_flashes' in session:
+                    return view(**kwargs)
+
+                key = group.format(**kwargs)
+                variant = request.full_path
+
+                page = self.backend.get(key, variant)
+                if page is not None:
+                    self._count('hits')
+                    response = make_response(page)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count('misses')
+                page = view(**kwargs)
+                if isinstance(page, str):
+                    timeout = self.replica_timeout if g.get('replica') else self.timeout
+                    self.backend.set(key, variant, page, timeout)
+
+                response = make_response(page)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self, *groups):
+        """Drops every cached variant of the given groups"""
+
+        if self.backend is None:
+            return
+        for group in groups:
+            self.backend.delete(group)
+        self._count('invalidations', len(groups))
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'entries': self.backend.size() if self.backend is not None else 0
+        }
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+cache = ResponseCache()
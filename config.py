@@ -1,11 +1,111 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Workers must share the key in production or sessions and CSRF break
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Profile: 'development' (default) or 'production'
+FYYUR_ENV = os.environ.get('FYYUR_ENV', 'development')
+
 # Enable debug mode.
-DEBUG = True
+DEBUG = FYYUR_ENV != 'production'
 
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = "postgres://{}@{}/{}".format('Tom', 'localhost:5432', 'booking')
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', "postgres://{}@{}/{}".format('Tom', 'localhost:5432', 'booking'))
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Production connection pool, sized per worker process: keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below PostgreSQL's max_connections
+if FYYUR_ENV == 'production':
+    from pool import InstrumentedQueuePool
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+
+    if SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(
+                int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000)))
+        }
+
+# Read replicas, comma-separated URLs. GET requests read from them in turn,
+# a user's reads stay on the primary for REPLICA_STICKY_SECONDS after they
+# write, and a replica that fails is retried after REPLICA_RETRY_SECONDS.
+# Pages read from a replica are cached for REPLICA_CACHE_TIMEOUT at most.
+SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+SQLALCHEMY_BINDS = {'replica_%d' % i: uri for i, uri in enumerate(SQLALCHEMY_REPLICA_URIS)}
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_RETRY_SECONDS = 15
+REPLICA_CACHE_TIMEOUT = 30
+
+# Shows listing page size
+SHOWS_PER_PAGE = 30
+SHOWS_MAX_PER_PAGE = 100
+
+# Search results and genre browse page sizes
+SEARCH_RESULTS_PER_PAGE = 20
+BROWSE_PER_PAGE = 50
+
+# Longest range /shows/availability answers for, largest show series
+AVAILABILITY_MAX_DAYS = 92
+SERIES_MAX_SHOWS = 500
+
+# Soft-deleted rows are purged in batches once this old, bulk deletes are capped
+PURGE_BATCH_SIZE = 500
+PURGE_GRACE_MINUTES = 60
+BULK_DELETE_MAX = 1000
+
+# Nearby venue search (/api/v1/venues/near)
+NEAR_RADIUS_KM = 10
+NEAR_MAX_RADIUS_KM = 200
+NEAR_MAX_RESULTS = 50
+
+# Run independent read queries of a request concurrently (see parallel.py).
+# Each one takes its own pooled connection, size the pool for it.
+PARALLEL_READS = os.environ.get('PARALLEL_READS') == '1'
+PARALLEL_READ_WORKERS = int(os.environ.get('PARALLEL_READ_WORKERS', 8))
+
+# Write-behind mode: form submissions go to a local SQLite queue drained in
+# batches by a background thread (see writequeue.py)
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND') == '1'
+WRITE_QUEUE_PATH = os.environ.get('WRITE_QUEUE_PATH', os.path.join(basedir, 'write_queue.db'))
+WRITE_QUEUE_MAX_DEPTH = int(os.environ.get('WRITE_QUEUE_MAX_DEPTH', 1000))
+WRITE_QUEUE_BATCH_SIZE = 100
+WRITE_QUEUE_POLL_SECONDS = 0.2
+WRITE_QUEUE_STALE_SECONDS = 300
+WRITE_QUEUE_KEEP_HOURS = 24
+WRITE_QUEUE_RETRY_AFTER = 5
+
+# Link the fingerprinted bundles built by `flask build-assets` (see assets.py)
+ASSETS_BUNDLED = os.environ.get('ASSETS_BUNDLED', '1' if FYYUR_ENV == 'production' else '0') == '1'
+
+# Rendered page cache: 'simple' (in-process LRU), 'redis' or 'null'.
+# A write only invalidates the LRU of the worker that handled it, other
+# workers would serve their stale copy until it expires. So production,
+# which runs several workers, caches in Redis when CACHE_REDIS_URL is set
+# and not at all otherwise. Only set CACHE_TYPE=simple with one worker.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if FYYUR_ENV == 'production':
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'redis' if CACHE_REDIS_URL else 'null')
+else:
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
+CACHE_REDIS_URL = CACHE_REDIS_URL or 'redis://localhost:6379/0'
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_MAX_ENTRIES = 500
+
+# Per-request SQL instrumentation, off unless SQL_INSTRUMENTATION=1
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+SLOW_QUERY_MS = 100
+N_PLUS_ONE_THRESHOLD = 10
+SLOW_QUERY_LOG = os.path.join(basedir, 'slow_queries.log')
+
+# Jinja bytecode cache, prebuilt at deploy time with 'flask precompile-templates'
+JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR',
+                                          os.path.join(basedir, '.jinja_cache'))
@@ -0,0 +1,194 @@
+"""
+Fyyur counters.py - Materialized show counters on Venue and Artist
+
+Venue and Artist carry upcoming_shows_count, past_shows_count and
+next_show_time so list pages never read the show table. The show create
+path bumps the counters in its own transaction, roll_over() moves shows
+that have started from upcoming to past, and check_drift() recomputes
+everything from show to catch anything that slipped through. Shows whose
+other side (the artist of a venue's show, the venue of an artist's show)
+is soft-deleted are not counted, as the detail pages do not list them.
+
+    flask rollover-shows          # run every few minutes from cron
+    flask check-show-counts --fix
+"""
+
+from datetime import datetime
+from sqlalchemy import and_, case, func, select
+from models import db, Venue, Artist, Show
+from cache import cache
+
+# Model, its foreign key on show
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+# Model -> the model on the other side of its shows, and that one's key on show
+COUNTERPARTS = {Venue: (Artist, Show.artist_id), Artist: (Venue, Show.venue_id)}
+
+
+def record_show(venue_id, artist_id, start_time, now=None):
+    """Counts a new show on its venue and artist, inside the caller's transaction
+
+    Parameters
+    ----------
+    venue_id : int
+        venue the show is at
+    artist_id : int
+        artist playing the show
+    start_time : datetime
+        show start time
+    now : datetime
+        reference time, defaults to now
+    """
+
+    now = now or datetime.now()
+
+    for model, owner_id in ((Venue, venue_id), (Artist, artist_id)):
+        if start_time > now:
+            values = {
+                'upcoming_shows_count': model.upcoming_shows_count + 1,
+                'next_show_time': case(
+                    [(and_(model.next_show_time.isnot(None),
+                           model.next_show_time <= start_time), model.next_show_time)],
+                    else_=start_time
+                )
+            }
+        else:
+            values = {'past_shows_count': model.past_shows_count + 1}
+
+        # Counter changes are not edits, keep updated_at (and the API ETags)
+        values['updated_at'] = model.updated_at
+        db.session.execute(model.__table__.update().where(model.id == owner_id).values(**values))
+
+
+def actual_counts(model, foreign_key, now):
+    """Correlated subqueries computing the counters of model from show"""
+
+    counterpart, counterpart_key = COUNTERPARTS[model]
+    live_shows = Show.__table__.join(counterpart.__table__, and_(
+        counterpart.id == counterpart_key, counterpart.deleted_at.is_(None)))
+
+    def shows(column):
+        return select([column]).select_from(live_shows).where(foreign_key == model.id)
+
+    return {
+        'upcoming_shows_count': shows(func.count(Show.id)).where(Show.start_time > now).as_scalar(),
+        'past_shows_count': shows(func.count(Show.id)).where(Show.start_time <= now).as_scalar(),
+        'next_show_time': shows(func.min(Show.start_time)).where(Show.start_time > now).as_scalar()
+    }
+
+
+def recount(model, ids=None, now=None):
+    """Recomputes the counters of some (or all) rows of model from show
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model whose counters are refreshed
+    ids : iterable (int)
+        rows to refresh, every row when None
+    now : datetime
+        reference time, defaults to now
+
+    Returns
+    -------
+    count : int
+        number of rows updated
+    """
+
+    now = now or datetime.now()
+    foreign_key = dict(OWNERS)[model]
+
+    values = actual_counts(model, foreign_key, now)
+    values['updated_at'] = model.updated_at
+    statement = model.__table__.update().values(**values)
+
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+        statement = statement.where(model.id.in_(ids))
+
+    return db.session.execute(statement).rowcount
+
+
+def recount_shows(mappings, now=None):
+    """Recomputes the venues and artists referenced by a batch of shows"""
+
+    recount(Venue, {mapping['venue_id'] for mapping in mappings}, now)
+    recount(Artist, {mapping['artist_id'] for mapping in mappings}, now)
+
+
+def roll_over(now=None):
+    """Moves shows that have started from upcoming to past
+
+    Only rows whose next_show_time has passed are recounted, found through
+    the next_show_time index, and their cached pages are dropped.
+
+    Returns
+    -------
+    rolled : dict
+        number of venues and artists updated
+    """
+
+    now = now or datetime.now()
+    rolled = {}
+    groups = []
+
+    for model, foreign_key in OWNERS:
+        ids = [row[0] for row in db.session.query(model.id).filter(model.next_show_time <= now)]
+        rolled[model.__tablename__] = recount(model, ids, now)
+        if ids:
+            groups.append(model.__tablename__ + 's')
+            groups.extend('%s:%d' % (model.__tablename__, owner_id) for owner_id in ids)
+
+    db.session.commit()
+    cache.invalidate(*groups)
+    return rolled
+
+
+def check_drift(fix=False, now=None):
+    """Compares the stored counters with counts recomputed from show
+
+    Parameters
+    ----------
+    fix : bool
+        recount the rows that drifted
+    now : datetime
+        reference time, defaults to now
+
+    Returns
+    -------
+    drift : list (dict)
+        table, id, stored and actual counters of every row that differs
+    """
+
+    now = now or datetime.now()
+    drift = []
+
+    for model, foreign_key in OWNERS:
+        actual = actual_counts(model, foreign_key, now)
+        rows = db.session.query(
+            model.id,
+            model.upcoming_shows_count,
+            model.past_shows_count,
+            model.next_show_time,
+            actual['upcoming_shows_count'],
+            actual['past_shows_count'],
+            actual['next_show_time']
+        ).all()
+
+        ids = []
+        for row in rows:
+            stored, computed = tuple(row[1:4]), tuple(row[4:7])
+            if stored != computed:
+                ids.append(row[0])
+                drift.append({'table': model.__tablename__, 'id': row[0],
+                              'stored': stored, 'actual': computed})
+
+        if fix:
+            recount(model, ids, now)
+
+    if fix:
+        db.session.commit()
+
+    return drift
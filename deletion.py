@@ -0,0 +1,156 @@
+"""
+Fyyur deletion.py - Soft deletes and the batched purge
+
+Deleting a venue or artist only stamps deleted_at, which every ORM query
+filters out (see models._exclude_deleted), so a delete is one indexed
+UPDATE however many shows the row has. purge() later hard-deletes the
+soft-deleted rows in small batches: their shows first, then their series
+and genre rows, then the rows themselves, each batch in its own short
+transaction so no table stays locked for long.
+
+    flask purge-deleted          # run every few minutes from cron
+"""
+
+from datetime import datetime, timedelta
+from models import db, Venue, Artist, Show, ShowSeries, with_deleted
+from areas import remove_venues
+from cache import cache
+from counters import recount
+from genres import ASSOCIATIONS
+from search import INDEXES
+
+# Model, its foreign key on show, the counterpart's key and model, its key on show_series
+OWNERS = {
+    Venue: (Show.venue_id, Show.artist_id, Artist, ShowSeries.venue_id),
+    Artist: (Show.artist_id, Show.venue_id, Venue, ShowSeries.artist_id)
+}
+
+
+def counterpart_ids(model, ids):
+    """Lists the ids of the counterparts sharing a show with the given rows"""
+
+    own_key, counterpart_key, counterpart, series_key = OWNERS[model]
+    return [row[0] for row in db.session.query(counterpart_key).
+            filter(own_key.in_(ids)).distinct()]
+
+
+def cache_groups(model, ids, counterparts=None):
+    """Lists the cached page groups that show any of the given rows"""
+
+    if counterparts is None:
+        counterparts = counterpart_ids(model, ids)
+
+    own, other = ('venue', 'artist') if model is Venue else ('artist', 'venue')
+    return ['venues', 'artists', 'shows'] + \
+        ['%s:%d' % (own, owner_id) for owner_id in ids] + \
+        ['%s:%d' % (other, owner_id) for owner_id in counterparts]
+
+
+def soft_delete(model, ids, now=None):
+    """Marks venues or artists deleted in one statement and commits
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model of the rows
+    ids : iterable (int)
+        rows to delete, unknown and already deleted ids are skipped
+    now : datetime
+        deletion time, defaults to now (UTC, like updated_at)
+
+    Returns
+    -------
+    deleted : list (int)
+        ids that were deleted
+    """
+
+    now = now or datetime.utcnow()
+    ids = list(ids)
+    if not ids:
+        return []
+
+    ids = [row[0] for row in db.session.query(model.id).filter(model.id.in_(ids))]
+    if not ids:
+        return []
+
+    counterparts = counterpart_ids(model, ids)
+    groups = cache_groups(model, ids, counterparts)
+    if model is Venue:
+        remove_venues(ids)
+
+    db.session.execute(model.__table__.update().
+                       where(model.id.in_(ids)).
+                       values(deleted_at=now, updated_at=now))
+    # The counterparts stop counting the shows with the deleted rows now, not at the purge
+    recount(OWNERS[model][2], counterparts)
+    db.session.commit()
+
+    INDEXES[model].invalidate()
+    cache.invalidate(*groups)
+    return ids
+
+
+def _purge_shows(model, ids, batch_size):
+    """Deletes the shows of some rows a batch at a time, recounting their counterparts"""
+
+    own_key, counterpart_key, counterpart, series_key = OWNERS[model]
+    purged = 0
+
+    while True:
+        shows = db.session.query(Show.id, counterpart_key). \
+            filter(own_key.in_(ids)). \
+            limit(batch_size). \
+            all()
+        if not shows:
+            return purged
+
+        db.session.execute(Show.__table__.delete().where(Show.id.in_([show[0] for show in shows])))
+        recount(counterpart, {show[1] for show in shows})
+        db.session.commit()
+        purged += len(shows)
+
+
+def purge(batch_size=500, older_than=timedelta(0), now=None):
+    """Hard-deletes soft-deleted venues and artists with their shows
+
+    Parameters
+    ----------
+    batch_size : int
+        rows deleted per transaction
+    older_than : timedelta
+        only rows deleted at least this long ago are purged
+    now : datetime
+        reference time, defaults to now (UTC)
+
+    Returns
+    -------
+    purged : dict
+        number of venues, artists and shows deleted
+    """
+
+    cutoff = (now or datetime.utcnow()) - older_than
+    purged = {'venues': 0, 'artists': 0, 'shows': 0}
+
+    for model, (own_key, counterpart_key, counterpart, series_key) in OWNERS.items():
+        table, owner_column = ASSOCIATIONS[model]
+
+        while True:
+            ids = [row[0] for row in with_deleted(db.session.query(model.id)).
+                   filter(model.deleted_at <= cutoff).
+                   order_by(model.id).
+                   limit(batch_size)]
+            if not ids:
+                break
+
+            purged['shows'] += _purge_shows(model, ids, batch_size)
+
+            db.session.execute(ShowSeries.__table__.delete().where(series_key.in_(ids)))
+            db.session.execute(table.delete().where(owner_column.in_(ids)))
+            db.session.execute(model.__table__.delete().where(model.id.in_(ids)))
+            db.session.commit()
+            purged[model.__tablename__ + 's'] += len(ids)
+
+    if purged['shows']:
+        cache.invalidate('venues', 'artists', 'shows')
+
+    return purged
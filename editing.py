@@ -0,0 +1,121 @@
+"""
+Fyyur editing.py - Optimistic-concurrency edits of venues and artists
+
+Venue and artist carry a version column, the mapper's version_id_col. The
+edit form holds the version the page was filled from. apply_edit() refuses
+a submission made from an older version, compares the submitted values with
+the stored row and sets only the columns that differ. The ORM then issues
+one UPDATE of those columns plus version and updated_at, with WHERE id = ?
+AND version = ?, so an edit committed in between matches no row and is
+reported as a conflict instead of being overwritten. A submission that
+changes nothing writes nothing and does not commit.
+"""
+
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, Venue, Artist
+
+# Columns an edit form can change
+EDITABLE = {
+    Venue: ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+            'genres', 'website', 'seeking_talent', 'seeking_description', 'latitude', 'longitude'),
+    Artist: ('name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+             'website', 'seeking_venue', 'seeking_description')
+}
+
+
+class EditConflict(Exception):
+    """The row changed since the edit form was loaded
+
+    entity is the current row, differences maps each field where the
+    submission and the current row disagree to (submitted, current).
+    """
+
+    def __init__(self, entity, differences):
+        super().__init__('{} {} was changed by another edit'.format(
+            entity.__tablename__, entity.id))
+        self.entity = entity
+        self.differences = differences
+
+
+def _blank(value):
+    # Empty form fields and NULL columns are the same value
+    return None if value == '' else value
+
+
+def differences(entity, values):
+    """Maps each field whose submitted value differs from the row to (submitted, stored)"""
+
+    return {key: (value, getattr(entity, key)) for key, value in values.items()
+            if _blank(value) != _blank(getattr(entity, key))}
+
+
+def form_values(model, form):
+    """Reads the editable fields of a model from a submitted form"""
+
+    return {key: getattr(form, key).data for key in EDITABLE[model]}
+
+
+def stage_edit(model, entity_id, version, values):
+    """Sets the changed fields of an edit on the row, without flushing or committing
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model of the row
+    entity_id : int
+        row to edit
+    version : int
+        version the edit form was loaded from
+    values : dict
+        submitted value of every editable field
+
+    Returns
+    -------
+    entity : Venue or Artist
+        the row, None if it does not exist
+    changed : list (String)
+        fields set, empty if the submission changes nothing
+
+    Raises
+    ------
+    EditConflict :
+        the row was edited after the form was loaded
+    """
+
+    entity = db.session.query(model).filter(model.id == entity_id).first()
+    if entity is None:
+        return None, []
+
+    if entity.version != version:
+        raise EditConflict(entity, differences(entity, values))
+
+    changed = differences(entity, values)
+    for key, (value, stored) in changed.items():
+        setattr(entity, key, _blank(value))
+
+    return entity, sorted(changed)
+
+
+def apply_edit(model, entity_id, version, values):
+    """Writes the changed fields of an edit and commits
+
+    Same parameters and results as stage_edit(). Nothing is committed when
+    nothing changed, and an edit committed by someone else between the
+    read and the UPDATE raises EditConflict too.
+    """
+
+    entity, changed = stage_edit(model, entity_id, version, values)
+    if not changed:
+        db.session.rollback()
+        return entity, changed
+
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        entity = db.session.query(model).filter(model.id == entity_id).first()
+        if entity is None:
+            return None, []
+        raise EditConflict(entity, differences(entity, values))
+
+    return entity, changed
@@ -13,6 +13,14 @@ def test():
         abort("Aborted at user request.")
 
 
+def bench():
+    with settings(warn_only=True):
+        result = local("python bench.py", capture=True)
+    print(result)
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
+        abort("Aborted at user request.")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -0,0 +1,89 @@
+"""
+Fyyur formatting.py - Show time formatting
+
+Babel patterns and locales are parsed once and memoized, native datetime
+values are formatted without a round-trip through str() and dateutil, and
+format_many() formats a whole list of show times with one pattern lookup.
+"""
+
+from functools import lru_cache
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+# Named formats used by the templates
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(pattern):
+    return babel.dates.parse_pattern(pattern)
+
+
+@lru_cache(maxsize=16)
+def get_locale(locale):
+    return Locale.parse(locale)
+
+
+def format_many(values, format='medium', locale=None):
+    """Formats a list of datetimes with one pattern and locale lookup
+
+    Parameters
+    ----------
+    values : list (datetime)
+        naive or aware datetimes, Strings are parsed
+    format : String
+        'full', 'medium', Babel's 'short'/'long' or a Babel pattern
+    locale : String
+        locale identifier, Babel's LC_TIME default when None
+
+    Returns
+    -------
+    formatted : list (String)
+        formatted values, in order
+    """
+
+    values = [dateutil.parser.parse(value) if isinstance(value, str) else value
+              for value in values]
+
+    if format in ('short', 'long'):
+        # Locale datetime formats combine separate date and time patterns
+        return [babel.dates.format_datetime(value, format, locale=locale or babel.dates.LC_TIME)
+                for value in values]
+
+    pattern = compiled_pattern(PATTERNS.get(format, format))
+    locale = get_locale(locale or babel.dates.LC_TIME)
+
+    return [pattern.apply(value, locale) for value in values]
+
+
+def format_datetime(value, format='medium', locale=None):
+    """Jinja 'datetime' filter, formats a single datetime or String"""
+
+    return format_many([value], format, locale)[0]
+
+
+def format_shows(shows, format='full', key='start_time'):
+    """Replaces the start time of every show dict with its formatted value
+
+    Parameters
+    ----------
+    shows : list (dict)
+        show data from Show.artist_detail(), venue_detail() or listing_detail()
+    format : String
+        format passed to format_many()
+    key : String
+        dict key holding the datetime
+
+    Returns
+    -------
+    shows : list (dict)
+        the same list, updated in place
+    """
+
+    for show, formatted in zip(shows, format_many([show[key] for show in shows], format)):
+        show[key] = formatted
+    return shows
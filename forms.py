@@ -1,8 +1,10 @@
 from datetime import datetime
+import dateutil.parser
 from flask_wtf import FlaskForm
 from enum import Enum
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, URL
+from wtforms import HiddenField, StringField, SelectField, SelectMultipleField, DateTimeField, DateField, BooleanField, FloatField, IntegerField
+from wtforms.validators import DataRequired, InputRequired, URL, Optional, NumberRange
+from models import SHOW_DEFAULT_MINUTES, SHOW_MAX_MINUTES
 
 
 class Genres(Enum):
@@ -104,20 +106,75 @@ states = [
 ]
 
 
+class ParsedDateTimeField(DateTimeField):
+    """DateTimeField accepting any date and time dateutil can parse"""
+
+    def process_formdata(self, valuelist):
+        if valuelist:
+            try:
+                self.data = dateutil.parser.parse(' '.join(valuelist))
+            except (ValueError, OverflowError):
+                self.data = None
+                raise ValueError(self.gettext('Not a valid datetime value'))
+
+
 class ShowForm(FlaskForm):
     """Holds data for creating a Show"""
 
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[InputRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[InputRequired()]
     )
-    start_time = DateTimeField(
+    start_time = ParsedDateTimeField(
         'start_time',
-        validators=[DataRequired()],
+        validators=[InputRequired()],
         default=datetime.today()
     )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[Optional(), NumberRange(1, SHOW_MAX_MINUTES)],
+        default=SHOW_DEFAULT_MINUTES
+    )
+
+
+class SeriesRuleForm(FlaskForm):
+    """Holds the recurrence rule of a show series"""
+
+    start_time = ParsedDateTimeField(
+        'start_time',
+        validators=[InputRequired()]
+    )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[Optional(), NumberRange(1, SHOW_MAX_MINUTES)],
+        default=SHOW_DEFAULT_MINUTES
+    )
+    frequency = SelectField(
+        'frequency', validators=[DataRequired()],
+        choices=[('weekly', 'Weekly'), ('daily', 'Daily'), ('monthly', 'Monthly')]
+    )
+    interval = IntegerField(
+        'interval',
+        validators=[InputRequired(), NumberRange(1, 52)],
+        default=1
+    )
+    until = DateField(
+        'until',
+        validators=[InputRequired()]
+    )
+
+
+class ShowSeriesForm(SeriesRuleForm):
+    """Holds data for creating a show series"""
+
+    artist_id = IntegerField(
+        'artist_id', validators=[InputRequired()]
+    )
+    venue_id = IntegerField(
+        'venue_id', validators=[InputRequired()]
+    )
 
 
 class VenueForm(FlaskForm):
@@ -158,6 +215,16 @@ class VenueForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description'
     )
+    latitude = FloatField(
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
+    # Row version the edit form was filled from
+    version = HiddenField(
+        'version'
+    )
 
 
 class ArtistForm(FlaskForm):
@@ -195,4 +262,7 @@ class ArtistForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description'
     )
+    version = HiddenField(
+        'version'
+    )
 
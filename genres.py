@@ -0,0 +1,142 @@
+"""
+Fyyur genres.py - Genre lookup table and association sync
+
+Venue.genres and Artist.genres hold genre names. Every ORM insert or
+update of those columns rewrites the row's venue_genre/artist_genre
+entries in the same flush. sync_genres() does the same set-wise after Core
+bulk inserts. The genre pages then read one index range per genre.
+"""
+
+from sqlalchemy import event, inspect
+from forms import Genres
+from models import db, Venue, Artist, Genre, venue_genre, artist_genre
+
+# Model, its association table and the table's foreign key column
+ASSOCIATIONS = {
+    Venue: (venue_genre, venue_genre.c.venue_id),
+    Artist: (artist_genre, artist_genre.c.artist_id)
+}
+
+_genre_ids = {}
+
+
+def seed_genres():
+    """Inserts any genre of forms.Genres missing from the genre table"""
+
+    known = {name for name, in db.session.query(Genre.name)}
+    missing = [{'name': genre.name, 'label': genre.value} for genre in Genres
+               if genre.name not in known]
+
+    if missing:
+        db.session.execute(Genre.__table__.insert(), missing)
+        db.session.commit()
+    _genre_ids.clear()
+
+
+def genre_ids(connection=None):
+    """Returns {genre name: id}, loaded once per process"""
+
+    if not _genre_ids:
+        query = Genre.__table__.select()
+        rows = connection.execute(query) if connection is not None else db.session.execute(query)
+        _genre_ids.update((row.name, row.id) for row in rows)
+    return _genre_ids
+
+
+def genre_id(name):
+    """Returns the id of a genre name, None for unknown genres"""
+
+    return genre_ids().get(name)
+
+
+def _association_rows(model, owner_id, names, ids):
+    table, owner_column = ASSOCIATIONS[model]
+    return [{'genre_id': ids[name], owner_column.name: owner_id}
+            for name in set(names or ()) if name in ids]
+
+
+def _write(connection, model, owners, ids):
+    table, owner_column = ASSOCIATIONS[model]
+    connection.execute(table.delete().where(owner_column.in_([owner_id for owner_id, names in owners])))
+
+    rows = []
+    for owner_id, names in owners:
+        rows.extend(_association_rows(model, owner_id, names, ids))
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def sync_genres(model, ids=None):
+    """Rebuilds the association rows of some (or all) rows of model
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model whose genres are indexed
+    ids : iterable (int)
+        rows to rebuild, every row when None
+    """
+
+    query = db.session.query(model.id, model.genres)
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+        query = query.filter(model.id.in_(ids))
+
+    owners = query.all()
+    if owners:
+        _write(db.session.connection(), model, owners, genre_ids())
+
+
+def _after_insert(mapper, connection, target):
+    _write(connection, type(target), [(target.id, target.genres)], genre_ids(connection))
+
+
+def _after_update(mapper, connection, target):
+    if inspect(target).attrs.genres.history.has_changes():
+        _write(connection, type(target), [(target.id, target.genres)], genre_ids(connection))
+
+
+for model in ASSOCIATIONS:
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_update', _after_update)
+
+
+def members(model, name, page=1, per_page=50):
+    """Lists one page of the venues or artists tagged with a genre
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model to list
+    name : String
+        genre name as stored in forms.Genres
+    page : int
+        1-based page
+    per_page : int
+        rows per page
+
+    Returns
+    -------
+    rows : list (Row)
+        id and name of each member on the page, by name; None if the genre
+        does not exist
+    has_next : bool
+        whether another page follows
+    """
+
+    gid = genre_id(name)
+    if gid is None:
+        return None, False
+
+    table, owner_column = ASSOCIATIONS[model]
+    rows = db.session.query(model.id, model.name). \
+        join(table, owner_column == model.id). \
+        filter(table.c.genre_id == gid). \
+        order_by(model.name, model.id). \
+        offset((max(page, 1) - 1) * per_page). \
+        limit(per_page + 1). \
+        all()
+
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,75 @@
+"""
+Gunicorn settings for serving Fyyur in production
+
+Each worker process owns its own connection pool, and each of its
+threads can hold one connection. Keep WEB_THREADS at or below
+DB_POOL_SIZE + DB_MAX_OVERFLOW, and WEB_CONCURRENCY * (DB_POOL_SIZE +
+DB_MAX_OVERFLOW) below PostgreSQL's max_connections.
+
+WEB_WORKER_CLASS=gevent serves each request in a greenlet instead, so a
+worker is not held while PostgreSQL answers; psycopg2 is made cooperative
+with psycogreen after the fork. Install both with
+pip install -r requirements-gevent.txt. Up to WEB_WORKER_CONNECTIONS
+requests share one pool, so they queue on DB_POOL_SIZE + DB_MAX_OVERFLOW
+connections rather than on threads.
+"""
+
+import multiprocessing
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401
+        import psycogreen.gevent  # noqa: F401
+    except ImportError as e:
+        raise SystemExit('WEB_WORKER_CLASS=gevent needs gevent and psycogreen ({}), '
+                         'install them with pip install -r requirements-gevent.txt'.format(e))
+timeout = 30
+keepalive = 5
+
+# Load the app once in the master, then fork; the copy-on-write pages are
+# shared between workers.
+preload_app = True
+
+# Recycle workers now and then so slow leaks never build up
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def on_starting(server):
+    if workers > 1 and os.environ.get('CACHE_TYPE') == 'simple':
+        server.log.warning('CACHE_TYPE=simple with %d workers: a write only invalidates the '
+                           'cache of its own worker, use CACHE_REDIS_URL instead', workers)
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+    # Connections opened in the master must not be shared across processes
+    from app import app
+
+    with app.app_context():
+        for engine in app.extensions['replicas'].engines().values():
+            engine.dispose()
+
+
+def post_worker_init(worker):
+    # Compile templates and fill the pool before the worker takes requests
+    from app import app
+    from warmup import warm
+    from wsgi import IMPORT_MS
+
+    timings = warm(app)
+    if app.config['WRITE_BEHIND']:
+        from writequeue import start_worker
+        start_worker(app)
+    worker.log.info('worker %s cold start: app import %sms, warm-up %s',
+                    worker.pid, IMPORT_MS, timings)
@@ -0,0 +1,126 @@
+"""
+Fyyur instrumentation.py - Per-request SQL instrumentation
+
+When SQL_INSTRUMENTATION is on, every statement executed during a request
+is timed through SQLAlchemy engine events. Each response then carries a
+Server-Timing header with the query count and total DB time. Statements
+slower than SLOW_QUERY_MS are written to the slow query log as JSON lines,
+as are statement shapes repeated more than N_PLUS_ONE_THRESHOLD times in one
+request. When the setting is off no listener is registered at all.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from logging import FileHandler, Formatter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('fyyur.sql')
+
+IN_LIST = re.compile(r'IN \((?:[^()]*)\)', re.IGNORECASE)
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Reduces a statement to its shape so repeats with other values match
+
+    Parameters
+    ----------
+    statement : String
+        SQL as sent to the driver
+
+    Returns
+    -------
+    shape : String
+        statement with IN lists, literals and whitespace collapsed
+    """
+
+    shape = IN_LIST.sub('IN (...)', statement)
+    shape = LITERAL.sub('?', shape)
+    return WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryInstrumentation:
+    """Counts and times SQL per request, configured from the app config
+
+    SQL_INSTRUMENTATION : turns the instrumentation on
+    SLOW_QUERY_MS : statements at least this slow are logged
+    N_PLUS_ONE_THRESHOLD : repeats of one shape above this are logged
+    SLOW_QUERY_LOG : file the slow query log is written to
+    """
+
+    def __init__(self, app=None):
+        self.slow_query_ms = 100
+        self.n_plus_one_threshold = 10
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('SQL_INSTRUMENTATION', False):
+            return
+
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', 100)
+        self.n_plus_one_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 10)
+
+        if not logger.handlers:
+            handler = FileHandler(app.config.get('SLOW_QUERY_LOG', 'slow_queries.log'))
+            handler.setFormatter(Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        g.sql_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+        g.sql_shapes = Counter()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = (time.perf_counter() - conn.info['query_started'].pop()) * 1000
+
+        if not has_request_context() or 'sql_queries' not in g:
+            return
+
+        g.sql_queries += 1
+        g.sql_time += elapsed
+        g.sql_shapes[statement_shape(statement)] += 1
+
+        if elapsed >= self.slow_query_ms:
+            self.log('slow_query', duration_ms=round(elapsed, 3), statement=statement)
+
+    def after_request(self, response):
+        if 'sql_queries' not in g:
+            return response
+
+        total = (time.perf_counter() - g.sql_started) * 1000
+
+        for shape, count in g.sql_shapes.items():
+            if count > self.n_plus_one_threshold:
+                self.log('n_plus_one', count=count, statement=shape)
+
+        response.headers.add('Server-Timing', 'db;dur={:.3f};desc="{} queries"'.format(
+            g.sql_time, g.sql_queries))
+        response.headers.add('Server-Timing', 'app;dur={:.3f}'.format(total))
+        return response
+
+    def log(self, kind, **fields):
+        fields.update(kind=kind, endpoint=request.endpoint, method=request.method,
+                      path=request.path)
+        logger.info(json.dumps(fields, sort_keys=True))
+
+
+instrumentation = QueryInstrumentation()
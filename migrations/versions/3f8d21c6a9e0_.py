@@ -0,0 +1,28 @@
+"""track row modification times for conditional GETs
+
+Revision ID: 3f8d21c6a9e0
+Revises: 9c1e4a7b2d35
+Create Date: 2026-10-18 11:40:05.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8d21c6a9e0'
+down_revision = '9c1e4a7b2d35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artist', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+    op.add_column('venue', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+    op.add_column('show', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+
+
+def downgrade():
+    op.drop_column('show', 'updated_at')
+    op.drop_column('venue', 'updated_at')
+    op.drop_column('artist', 'updated_at')
@@ -0,0 +1,49 @@
+"""area index and venue coordinates
+
+Revision ID: 5d07c3e8b4a1
+Revises: e4a9d1b3c702
+Create Date: 2026-10-18 16:04:52.107733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d07c3e8b4a1'
+down_revision = 'e4a9d1b3c702'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_area_state_city', 'area', ['state', 'city'], unique=True)
+
+    # Backfill from the venue table
+    op.execute(
+        """
+        INSERT INTO area (state, city, venue_count)
+        SELECT state, city, count(*) FROM venue
+        WHERE state IS NOT NULL AND city IS NOT NULL
+        GROUP BY state, city
+        """
+    )
+
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_index('ix_venue_latitude_longitude', 'venue', ['latitude', 'longitude'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_latitude_longitude', table_name='venue')
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
+    op.drop_index('ix_area_state_city', table_name='area')
+    op.drop_table('area')
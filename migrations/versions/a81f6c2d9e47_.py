@@ -0,0 +1,40 @@
+"""show duration and overlap exclusion constraints
+
+Revision ID: a81f6c2d9e47
+Revises: 5d07c3e8b4a1
+Create Date: 2026-10-18 16:48:15.502394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81f6c2d9e47'
+down_revision = '5d07c3e8b4a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('show', sa.Column('duration_minutes', sa.SmallInteger(), server_default='120', nullable=False))
+
+    # Fails if existing shows overlap; list them with the query below and
+    # move or shorten them first:
+    #   SELECT a.id, b.id FROM show a JOIN show b ON a.id < b.id
+    #     AND (a.venue_id = b.venue_id OR a.artist_id = b.artist_id)
+    #     AND a.start_time < b.start_time + b.duration_minutes * interval '1 minute'
+    #     AND b.start_time < a.start_time + a.duration_minutes * interval '1 minute'
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for owner in ('venue_id', 'artist_id'):
+        op.execute(
+            "ALTER TABLE show ADD CONSTRAINT ex_show_{owner}_overlap EXCLUDE USING gist "
+            "({owner} WITH =, tsrange(start_time, start_time + duration_minutes * interval '1 minute') WITH &&)".
+            format(owner=owner)
+        )
+
+
+def downgrade():
+    for owner in ('artist_id', 'venue_id'):
+        op.drop_constraint('ex_show_{}_overlap'.format(owner), 'show')
+    op.drop_column('show', 'duration_minutes')
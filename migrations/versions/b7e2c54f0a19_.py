@@ -0,0 +1,45 @@
+"""materialized show counters on venue and artist
+
+Revision ID: b7e2c54f0a19
+Revises: 3f8d21c6a9e0
+Create Date: 2026-10-18 14:02:37.661940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c54f0a19'
+down_revision = '3f8d21c6a9e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_time', sa.DateTime(), nullable=True))
+        op.create_index(op.f('ix_{}_next_show_time'.format(table)), table, ['next_show_time'], unique=False)
+
+        # Backfill from the show table
+        op.execute(
+            """
+            UPDATE {table} SET
+                upcoming_shows_count = (SELECT count(*) FROM show
+                                        WHERE show.{table}_id = {table}.id AND show.start_time > now()),
+                past_shows_count = (SELECT count(*) FROM show
+                                    WHERE show.{table}_id = {table}.id AND show.start_time <= now()),
+                next_show_time = (SELECT min(show.start_time) FROM show
+                                  WHERE show.{table}_id = {table}.id AND show.start_time > now())
+            """.format(table=table)
+        )
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index(op.f('ix_{}_next_show_time'.format(table)), table_name=table)
+        op.drop_column(table, 'next_show_time')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,49 @@
+"""show series
+
+Revision ID: c3b58e1f7d20
+Revises: a81f6c2d9e47
+Create Date: 2026-10-18 17:35:40.884126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3b58e1f7d20'
+down_revision = 'a81f6c2d9e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_series',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('first_start', sa.DateTime(), nullable=False),
+    sa.Column('until', sa.DateTime(), nullable=False),
+    sa.Column('frequency', sa.String(length=10), nullable=False),
+    sa.Column('interval', sa.SmallInteger(), server_default='1', nullable=False),
+    sa.Column('duration_minutes', sa.SmallInteger(), server_default='120', nullable=False),
+    sa.Column('cancelled_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_show_series_artist_id'), 'show_series', ['artist_id'], unique=False)
+    op.create_index(op.f('ix_show_series_venue_id'), 'show_series', ['venue_id'], unique=False)
+
+    op.add_column('show', sa.Column('series_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_show_series_id'), 'show', ['series_id'], unique=False)
+    op.create_foreign_key('show_series_id_fkey', 'show', 'show_series', ['series_id'], ['id'])
+
+
+def downgrade():
+    op.drop_constraint('show_series_id_fkey', 'show', type_='foreignkey')
+    op.drop_index(op.f('ix_show_series_id'), table_name='show')
+    op.drop_column('show', 'series_id')
+    op.drop_index(op.f('ix_show_series_venue_id'), table_name='show_series')
+    op.drop_index(op.f('ix_show_series_artist_id'), table_name='show_series')
+    op.drop_table('show_series')
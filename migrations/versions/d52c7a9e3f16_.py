@@ -0,0 +1,37 @@
+"""indexed full-text search document for venues and artists
+
+Revision ID: d52c7a9e3f16
+Revises: 8b4f1e2d6c57
+Create Date: 2026-10-18 21:12:07.438915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd52c7a9e3f16'
+down_revision = '8b4f1e2d6c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Same definition as models.SEARCH_DOCUMENT_FUNCTION
+    op.execute(
+        "CREATE OR REPLACE FUNCTION search_document(name text, city text, state text, genres varchar[]) "
+        "RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$ "
+        "SELECT to_tsvector('simple', concat_ws(' ', name, city, state, array_to_string(genres, ' '))) "
+        "$$"
+    )
+    for table in ('venue', 'artist'):
+        op.execute(
+            "CREATE INDEX ix_{table}_search_document ON {table} "
+            "USING gin (search_document(name, city, state, genres))".format(table=table)
+        )
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_search_document'.format(table), table_name=table)
+    op.execute('DROP FUNCTION search_document(text, text, text, varchar[])')
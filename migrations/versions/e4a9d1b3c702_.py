@@ -0,0 +1,63 @@
+"""genre lookup and association tables
+
+Revision ID: e4a9d1b3c702
+Revises: b7e2c54f0a19
+Create Date: 2026-10-18 15:21:09.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9d1b3c702'
+down_revision = 'b7e2c54f0a19'
+branch_labels = None
+depends_on = None
+
+# forms.Genres at the time of this revision
+GENRES = [
+    ('Alternative', 'Alternative'), ('Blues', 'Blues'), ('Classical', 'Classical'),
+    ('Country', 'Country'), ('Electronic', 'Electronic'), ('Folk', 'Folk'), ('Funk', 'Funk'),
+    ('HipHop', 'Hip-Hop'), ('Heavy_Metal', 'Heavy Metal'), ('Instrumental', 'Instrumental'),
+    ('Jazz', 'Jazz'), ('Musical_Theatre', 'Musical Theatre'), ('Pop', 'Pop'), ('Punk', 'Punk'),
+    ('RnB', 'R&B'), ('Reggae', 'Reggae'), ('Rock_n_Roll', 'Rock n Roll'), ('Soul', 'Soul'),
+    ('Other', 'Other')
+]
+
+
+def upgrade():
+    genre = op.create_table('genre',
+    sa.Column('id', sa.SmallInteger(), nullable=False),
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('label', sa.String(length=40), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genre, [{'name': name, 'label': label} for name, label in GENRES])
+
+    for table in ('venue', 'artist'):
+        op.create_table('{}_genre'.format(table),
+        sa.Column('genre_id', sa.SmallInteger(), nullable=False),
+        sa.Column('{}_id'.format(table), sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+        sa.ForeignKeyConstraint(['{}_id'.format(table)], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('genre_id', '{}_id'.format(table))
+        )
+        op.create_index('ix_{0}_genre_{0}_id'.format(table), '{}_genre'.format(table),
+                        ['{}_id'.format(table)], unique=False)
+
+        # Backfill from the genres arrays
+        op.execute(
+            """
+            INSERT INTO {table}_genre (genre_id, {table}_id)
+            SELECT DISTINCT g.id, t.id FROM {table} t JOIN genre g ON g.name = ANY(t.genres)
+            """.format(table=table)
+        )
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{0}_genre_{0}_id'.format(table), table_name='{}_genre'.format(table))
+        op.drop_table('{}_genre'.format(table))
+    op.drop_table('genre')
@@ -0,0 +1,47 @@
+"""soft delete and cascading foreign keys
+
+Revision ID: f6d2a9b41c83
+Revises: c3b58e1f7d20
+Create Date: 2026-10-18 18:22:03.417965
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6d2a9b41c83'
+down_revision = 'c3b58e1f7d20'
+branch_labels = None
+depends_on = None
+
+# Table, constraint, column, referenced table, ON DELETE
+FOREIGN_KEYS = [
+    ('show', 'show_venue_id_fkey', 'venue_id', 'venue', 'CASCADE'),
+    ('show', 'show_artist_id_fkey', 'artist_id', 'artist', 'CASCADE'),
+    ('show', 'show_series_id_fkey', 'series_id', 'show_series', 'SET NULL'),
+    ('show_series', 'show_series_venue_id_fkey', 'venue_id', 'venue', 'CASCADE'),
+    ('show_series', 'show_series_artist_id_fkey', 'artist_id', 'artist', 'CASCADE')
+]
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        # Partial index, only the rows waiting to be purged are in it
+        op.create_index('ix_{}_deleted_at'.format(table), table, ['deleted_at'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+    for table, name, column, referred, ondelete in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+
+
+def downgrade():
+    for table, name, column, referred, ondelete in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'])
+
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_deleted_at'.format(table), table_name=table)
+        op.drop_column(table, 'deleted_at')
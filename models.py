@@ -1,10 +1,20 @@
-from flask import flash
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ARRAY, ForeignKey
-from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, event, Column, String, Integer, SmallInteger, Float, Boolean, DateTime, ARRAY, JSON, ForeignKey, Index, and_, func, text, tuple_
+from replicas import RoutingSQLAlchemy
+import replicas
+from sqlalchemy.orm import Load, Query
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import BinaryExpression, BooleanClauseList
 from flask_migrate import Migrate
-from sqlalchemy.exc import SQLAlchemyError
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+# PostgreSQL array of genre names, JSON on SQLite so local runs work
+GenreList = ARRAY(String).with_variant(JSON(), 'sqlite')
+
+# Show length when none is given, and the longest show that can be booked
+SHOW_DEFAULT_MINUTES = 120
+SHOW_MAX_MINUTES = 12 * 60
 
 
 def setup_db(app):
@@ -12,16 +22,125 @@ def setup_db(app):
     app.config.from_object('config')
     db.app = app
     db.init_app(app)
+    replicas.init_app(app, db)
     migrate = Migrate(app, db)
     return db
+
+
+def load_with_shows(model, entity_id, now):
+    """Loads a Venue or Artist together with all of its shows in one query
+
+    Each Show is fetched alongside its counterpart (the Artist for a Venue,
+    the Venue for an Artist) and the Show.artist / Show.venue backrefs are
+    populated from the same rows, so no lazy load is issued per show.
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model of the entity to load
+    entity_id : int
+        id of the entity to load
+    now : datetime
+        single timestamp used to split past and upcoming shows
+
+    Returns
+    -------
+    entity : Venue or Artist
+        the loaded entity, None if no row has the given id
+    past_shows : list (Show)
+        shows starting at or before now, oldest first
+    upcoming_shows : list (Show)
+        shows starting after now, soonest first
+    """
+
+    if model is Venue:
+        counterpart, own_key, counterpart_key = Artist, Show.venue_id, Show.artist_id
+        counterpart_attr = 'artist'
+    else:
+        counterpart, own_key, counterpart_key = Venue, Show.artist_id, Show.venue_id
+        counterpart_attr = 'venue'
+
+    rows = db.session.query(model, Show). \
+        outerjoin(Show, own_key == model.id). \
+        outerjoin(counterpart, and_(counterpart.id == counterpart_key,
+                                    counterpart.deleted_at.is_(None))). \
+        options(Load(Show).contains_eager(counterpart_attr)). \
+        filter(model.id == entity_id). \
+        order_by(Show.start_time). \
+        all()
+
+    if not rows:
+        return None, [], []
+
+    past_shows = []
+    upcoming_shows = []
+
+    for entity, show in rows:
+        # No show, or one whose counterpart is soft-deleted
+        if show is None or getattr(show, counterpart_attr) is None:
+            continue
+        # Same boundary as the counters in counters.py
+        if show.start_time <= now:
+            past_shows.append(show)
+        else:
+            upcoming_shows.append(show)
+
+    return rows[0][0], past_shows, upcoming_shows
+
+
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
+@event.listens_for(Query, 'before_compile', retval=True)
+def _exclude_deleted(query):
+    """Hides soft-deleted venues and artists from every ORM query
+
+    Adds deleted_at IS NULL once for each model with a deleted_at column
+    among the selected entities and columns, unless the query already
+    filters on it or was made with with_deleted().
+    """
+
+    if query._execution_options.get('include_deleted'):
+        return query
+
+    # Tables whose deleted_at IS NULL is already one of the ANDed conditions
+    filtered = set()
+    criterion = query._criterion
+    if criterion is not None:
+        terms = criterion.clauses if isinstance(criterion, BooleanClauseList) and \
+            criterion.operator is operators.and_ else [criterion]
+        for term in terms:
+            if isinstance(term, BinaryExpression) and term.operator is operators.is_ and \
+                    isinstance(term.left, Column) and term.left.name == 'deleted_at':
+                filtered.add(term.left.table)
+
+    for description in query.column_descriptions:
+        deleted_at = getattr(description['entity'], 'deleted_at', None)
+        if deleted_at is not None and deleted_at.property.columns[0].table not in filtered:
+            filtered.add(deleted_at.property.columns[0].table)
+            query = query.enable_assertions(False).filter(deleted_at.is_(None))
+
+    return query
+
+
+def with_deleted(query):
+    """Lets a query see soft-deleted rows"""
+
+    return query.execution_options(include_deleted=True)
+
+
 
 class Venue(db.Model):
     """Holds data for Venues"""
     __tablename__ = 'venue'
+    __table_args__ = (
+        Index('ix_venue_city_state', 'city', 'state'),
+        Index('ix_venue_latitude_longitude', 'latitude', 'longitude'),
+        Index('ix_venue_deleted_at', 'deleted_at', postgresql_where=text('deleted_at IS NOT NULL')),
+        Index('ix_venue_name_trgm', 'name', postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
@@ -30,13 +149,25 @@ class Venue(db.Model):
     phone = Column(String(120))
     image_link = Column(String(500))
     facebook_link = Column(String(120))
-    genres = Column(ARRAY(String))
+    genres = Column(GenreList)
     website = Column(String(120))
     seeking_talent = Column(Boolean, default=False)
     seeking_description = Column(String(120))
     address = Column(String(120))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    upcoming_shows_count = Column(Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = Column(Integer, nullable=False, default=0, server_default='0')
+    next_show_time = Column(DateTime, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                        server_default=func.now())
+    deleted_at = Column(DateTime)
+    version = Column(Integer, nullable=False, server_default='1')
+
+    shows = db.relationship('Show', backref='venue', lazy='dynamic', passive_deletes=True)
 
-    shows = db.relationship('Show', backref='venue', lazy='dynamic')
+    # Every ORM UPDATE bumps version and matches on the one it loaded (see editing.py)
+    __mapper_args__ = {'version_id_col': version}
 
     def __init__(self, name, city, state, phone, image_link,
                  facebook_link, genres, website, seeking_description="",
@@ -83,24 +214,42 @@ class Venue(db.Model):
         self.address = address
         self.seeking_talent = seeking_talent
 
-    def delete(self):
-        """Deletes Venue item from database
+    def cache_groups(self):
+        """Lists the cached page groups that show this venue's data"""
+
+        artist_ids = db.session.query(Show.artist_id). \
+            filter(Show.venue_id == self.id). \
+            distinct(). \
+            all()
+
+        groups = ['venues', 'venue:%d' % self.id]
+        if artist_ids:
+            groups.append('shows')
+            groups.extend('artist:%d' % artist_id for artist_id, in artist_ids)
+        return groups
+
+    @staticmethod
+    def areas():
+        """Lists every venue with its upcoming show count
 
-        Raises
-        ------
-        SQLAlchemyError :
-            raises error on failed delete attempt
+        Counts come from the materialized upcoming_shows_count column kept
+        by counters.py, so the show table is not read at all.
+
+        Returns
+        -------
+        rows : list (Row)
+            id, name, city, state and num_upcoming_shows for each venue,
+            ordered so that venues in the same city/state are adjacent
         """
 
-        try:
-            db.session.delete(self)
-            db.session.commit()
-            flash(self.name + ' was successfully deleted!')
-        except SQLAlchemyError as e:
-            flash('Error! Venue could not be deleted')
-            db.session.rollback()
-        finally:
-            db.session.close()
+        return db.session.query(
+            Venue.id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+            Venue.upcoming_shows_count.label('num_upcoming_shows')
+        ).order_by(Venue.state, Venue.city, Venue.name). \
+            all()
 
     def title(self):
         return {
@@ -121,7 +270,9 @@ class Venue(db.Model):
             'facebook_link': self.facebook_link,
             'seeking_talent': self.seeking_talent,
             'seeking_description': self.seeking_description,
-            'image_link': self.image_link
+            'image_link': self.image_link,
+            'latitude': self.latitude,
+            'longitude': self.longitude
         }
 
 
@@ -129,20 +280,34 @@ class Artist(db.Model):
     """Holds data for Artist"""
 
     __tablename__ = 'artist'
+    __table_args__ = (
+        Index('ix_artist_deleted_at', 'deleted_at', postgresql_where=text('deleted_at IS NOT NULL')),
+        Index('ix_artist_name_trgm', 'name', postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
     city = Column(String(120))
     state = Column(String(120))
     phone = Column(String(120))
-    genres = Column(ARRAY(String))
+    genres = Column(GenreList)
     image_link = Column(String(500))
     facebook_link = Column(String(120))
     website = Column(String(120))
     seeking_venue = Column(Boolean, default=False)
     seeking_description = Column(String(120))
+    upcoming_shows_count = Column(Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = Column(Integer, nullable=False, default=0, server_default='0')
+    next_show_time = Column(DateTime, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                        server_default=func.now())
+    deleted_at = Column(DateTime)
+    version = Column(Integer, nullable=False, server_default='1')
+
+    shows = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
 
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    __mapper_args__ = {'version_id_col': version}
 
     def __init__(self, name, city, state, phone, genres, image_link, facebook_link, website,
                  seeking_description="", seeking_venue=False):
@@ -185,6 +350,20 @@ class Artist(db.Model):
         self.seeking_description = seeking_description
         self.seeking_venue = seeking_venue
 
+    def cache_groups(self):
+        """Lists the cached page groups that show this artist's data"""
+
+        venue_ids = db.session.query(Show.venue_id). \
+            filter(Show.artist_id == self.id). \
+            distinct(). \
+            all()
+
+        groups = ['artists', 'artist:%d' % self.id]
+        if venue_ids:
+            groups.append('shows')
+            groups.extend('venue:%d' % venue_id for venue_id, in venue_ids)
+        return groups
+
     def title(self):
         return {
             'id': self.id,
@@ -211,11 +390,20 @@ class Show(db.Model):
     """Holds data for Show"""
 
     __tablename__ = 'show'
+    __table_args__ = (
+        Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
 
     id = Column(Integer, primary_key=True)
-    artist_id = Column(Integer, ForeignKey('artist.id'))
-    venue_id = Column(Integer, ForeignKey('venue.id'))
+    artist_id = Column(Integer, ForeignKey('artist.id', ondelete='CASCADE'))
+    venue_id = Column(Integer, ForeignKey('venue.id', ondelete='CASCADE'))
     start_time = Column(DateTime, nullable=False)
+    duration_minutes = Column(SmallInteger, nullable=False, default=SHOW_DEFAULT_MINUTES,
+                              server_default=str(SHOW_DEFAULT_MINUTES))
+    series_id = Column(Integer, ForeignKey('show_series.id', ondelete='SET NULL'), index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                        server_default=func.now())
 
     def __init__(self, artist_id, venue_id, start_time):
         """__init__ for Show
@@ -234,6 +422,10 @@ class Show(db.Model):
         self.venue_id = venue_id
         self.start_time = start_time
 
+    @property
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration_minutes or SHOW_DEFAULT_MINUTES)
+
     def detail(self):
         return {
             'venue_id': self.venue_id,
@@ -244,12 +436,77 @@ class Show(db.Model):
             'start_time': str(self.start_time)
         }
 
+    def cache_groups(self):
+        """Lists the cached page groups that show this show"""
+
+        return ['shows', 'venues', 'venue:%s' % self.venue_id, 'artist:%s' % self.artist_id]
+
+    @staticmethod
+    def page(after=None, limit=30):
+        """Lists one page of shows ordered by start_time, id
+
+        The SHOW_LISTING projection selects Venue and Artist columns in the
+        same joined query, so no Show, Venue or Artist instance is loaded.
+        Pages are located by a (start_time, id) keyset cursor rather than an
+        offset, so every page costs the same no matter how deep into the
+        history it is.
+
+        Parameters
+        ----------
+        after : tuple (datetime, int)
+            start_time and id of the last show on the previous page
+        limit : int
+            maximum number of shows on the page
+
+        Returns
+        -------
+        shows : list (dict)
+            show data in the same shape as Show.detail()
+        next_cursor : tuple (datetime, int)
+            cursor for the following page, None on the last page
+        """
+
+        query = Show.listing_query()
+
+        if after is not None:
+            query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+
+        rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].start_time, rows[-1].id)
+
+        return [Show.listing_detail(row) for row in rows], next_cursor
+
+    @staticmethod
+    def listing_query():
+        """Query for SHOW_LISTING rows, shows joined to their venue and artist"""
+
+        return SHOW_LISTING.query(). \
+            join(Venue, Venue.id == Show.venue_id). \
+            join(Artist, Artist.id == Show.artist_id)
+
+    @staticmethod
+    def listing_detail(row):
+        """Same dict as Show.detail(), built from a SHOW_LISTING row"""
+
+        return {
+            'venue_id': row.venue_id,
+            'venue_name': row.venue_name,
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.start_time
+        }
+
     def artist_detail(self):
         return {
             'artist_id': self.artist_id,
             'artist_name': self.artist.name,
             'artist_image_link': self.artist.image_link,
-            'start_time': self.start_time.strftime("%m/%d/%Y, %H:%M")
+            'start_time': self.start_time
         }
 
     def venue_detail(self):
@@ -257,6 +514,200 @@ class Show(db.Model):
             'venue_id': self.venue_id,
             'venue_name': self.venue.name,
             'venue_image_link': self.venue.image_link,
-            'start_time': self.start_time.strftime("%m/%d/%Y, %H:%M")
+            'start_time': self.start_time
+        }
+
+
+class ShowSeries(db.Model):
+    """Recurring shows of one artist at one venue
+
+    The series holds the recurrence rule, its shows are ordinary Show rows
+    pointing back through Show.series_id. series.py expands, edits and
+    cancels the shows of a series together.
+    """
+
+    __tablename__ = 'show_series'
+
+    id = Column(Integer, primary_key=True)
+    venue_id = Column(Integer, ForeignKey('venue.id', ondelete='CASCADE'), nullable=False, index=True)
+    artist_id = Column(Integer, ForeignKey('artist.id', ondelete='CASCADE'), nullable=False, index=True)
+    first_start = Column(DateTime, nullable=False)
+    until = Column(DateTime, nullable=False)
+    frequency = Column(String(10), nullable=False)
+    interval = Column(SmallInteger, nullable=False, default=1, server_default='1')
+    duration_minutes = Column(SmallInteger, nullable=False, default=SHOW_DEFAULT_MINUTES,
+                              server_default=str(SHOW_DEFAULT_MINUTES))
+    cancelled_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                        server_default=func.now())
+
+    venue = db.relationship('Venue')
+    artist = db.relationship('Artist')
+
+    def detail(self):
+        return {
+            'id': self.id,
+            'venue_id': self.venue_id,
+            'venue_name': self.venue.name,
+            'artist_id': self.artist_id,
+            'artist_name': self.artist.name,
+            'first_start': self.first_start,
+            'until': self.until,
+            'frequency': self.frequency,
+            'interval': self.interval,
+            'duration_minutes': self.duration_minutes,
+            'cancelled_at': self.cancelled_at
         }
 
+    def cache_groups(self):
+        """Lists the cached page groups that show this series' shows"""
+
+        return ['shows', 'venues', 'artists', 'venue:%s' % self.venue_id,
+                'artist:%s' % self.artist_id]
+
+
+# The gin_trgm_ops name indexes of venue and artist need pg_trgm, created
+# before any table so create_all() works on a fresh database.
+event.listen(db.Model.metadata, 'before_create', DDL(
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+).execute_if(dialect='postgresql'))
+
+# The full-text document search.py matches venues and artists against.
+# concat_ws and array_to_string are only STABLE, so the expression is
+# wrapped in an IMMUTABLE function that a GIN expression index can use.
+SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION search_document(name text, city text, state text, genres varchar[])
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+    SELECT to_tsvector('simple', concat_ws(' ', name, city, state, array_to_string(genres, ' ')))
+$$
+"""
+
+event.listen(db.Model.metadata, 'before_create', DDL(
+    SEARCH_DOCUMENT_FUNCTION
+).execute_if(dialect='postgresql'))
+
+for _table in (Venue.__table__, Artist.__table__):
+    event.listen(_table, 'after_create', DDL(
+        "CREATE INDEX ix_%(table)s_search_document ON %(table)s "
+        "USING gin (search_document(name, city, state, genres))"
+    ).execute_if(dialect='postgresql'))
+
+# Overlapping shows at one venue or for one artist are rejected by the
+# database. Exclusion constraints need btree_gist for the equality part.
+event.listen(Show.__table__, 'before_create', DDL(
+    "CREATE EXTENSION IF NOT EXISTS btree_gist"
+).execute_if(dialect='postgresql'))
+
+for _owner in ('venue_id', 'artist_id'):
+    event.listen(Show.__table__, 'after_create', DDL(
+        "ALTER TABLE show ADD CONSTRAINT ex_show_{owner}_overlap EXCLUDE USING gist "
+        "({owner} WITH =, tsrange(start_time, start_time + duration_minutes * interval '1 minute') WITH &&)".
+        format(owner=_owner)
+    ).execute_if(dialect='postgresql'))
+
+
+class Genre(db.Model):
+    """Lookup table of the genres in forms.Genres
+
+    Venue.genres and Artist.genres keep the genre names for display, the
+    venue_genre and artist_genre association tables index them by genre so
+    genre pages read only the matching rows. genres.py keeps both in sync.
+    """
+
+    __tablename__ = 'genre'
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = Column(SmallInteger().with_variant(Integer(), 'sqlite'), primary_key=True)
+    name = Column(String(40), unique=True, nullable=False)
+    label = Column(String(40), nullable=False)
+
+
+# Primary keys lead with genre_id so a genre's members are one index range
+venue_genre = db.Table(
+    'venue_genre',
+    Column('genre_id', SmallInteger, ForeignKey('genre.id'), primary_key=True),
+    Column('venue_id', Integer, ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_venue_genre_venue_id', 'venue_id')
+)
+
+artist_genre = db.Table(
+    'artist_genre',
+    Column('genre_id', SmallInteger, ForeignKey('genre.id'), primary_key=True),
+    Column('artist_id', Integer, ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_artist_genre_artist_id', 'artist_id')
+)
+
+
+class Area(db.Model):
+    """Index of the city/state areas that have venues
+
+    One row per area with its venue count, maintained by areas.py on every
+    venue insert, update and delete, so area pages and the area list never
+    aggregate the venue table.
+    """
+
+    __tablename__ = 'area'
+    __table_args__ = (
+        Index('ix_area_state_city', 'state', 'city', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    state = Column(String(120), nullable=False)
+    city = Column(String(120), nullable=False)
+    venue_count = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+# ----------------------------------------------------------------------------#
+# Projections.
+# ----------------------------------------------------------------------------#
+
+
+class Projection:
+    """Declares the columns a view needs
+
+    Queries built from a projection select only those columns, labelled with
+    the given names. They return SQLAlchemy's slotted named-tuple rows
+    instead of mapped instances, so nothing is hydrated or tracked in the
+    identity map. Rows expose each column as an attribute, which is all the
+    detail() builders above read, so a row can be passed to them in place
+    of an instance.
+    """
+
+    def __init__(self, **columns):
+        self.fields = tuple(columns)
+        self.source = columns
+        self.columns = [column.label(name) for name, column in columns.items()]
+
+    def query(self):
+        return db.session.query(*self.columns)
+
+    def get(self, entity_id):
+        """Returns the row whose primary key (the 'id' column) is entity_id"""
+
+        return self.query().filter(self.source['id'] == entity_id).first()
+
+
+VENUE_TITLE = Projection(id=Venue.id, name=Venue.name)
+
+ARTIST_TITLE = Projection(id=Artist.id, name=Artist.name)
+
+VENUE_DETAIL = Projection(
+    id=Venue.id, name=Venue.name, genres=Venue.genres, address=Venue.address,
+    city=Venue.city, state=Venue.state, phone=Venue.phone, website=Venue.website,
+    facebook_link=Venue.facebook_link, seeking_talent=Venue.seeking_talent,
+    seeking_description=Venue.seeking_description, image_link=Venue.image_link,
+    latitude=Venue.latitude, longitude=Venue.longitude, version=Venue.version
+)
+
+ARTIST_DETAIL = Projection(
+    id=Artist.id, name=Artist.name, genres=Artist.genres, city=Artist.city,
+    state=Artist.state, phone=Artist.phone, website=Artist.website,
+    facebook_link=Artist.facebook_link, seeking_venue=Artist.seeking_venue,
+    seeking_description=Artist.seeking_description, image_link=Artist.image_link,
+    version=Artist.version
+)
+
+SHOW_LISTING = Projection(
+    id=Show.id, start_time=Show.start_time, venue_id=Show.venue_id, venue_name=Venue.name,
+    artist_id=Show.artist_id, artist_name=Artist.name, artist_image_link=Artist.image_link
+)
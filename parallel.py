@@ -0,0 +1,77 @@
+"""
+Fyyur parallel.py - Runs independent read queries at the same time
+
+A request that needs several unrelated queries (the two searches of
+/search, the version queries of the API) normally waits for them one after
+another. gather() sends them together instead, each on its own pooled
+connection, so the request waits about as long as the slowest one. It is
+on when PARALLEL_READS is set; off, the calls run in order on the request's
+own session.
+
+Each call runs in a pool thread with its own app context, so it gets its
+own scoped session and connection, released when the call returns. Under
+the gevent worker (WEB_WORKER_CLASS=gevent) those threads are greenlets and
+the queries wait on the database without holding an OS thread.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from flask import current_app, g
+from models import db
+
+_executor = None
+_executor_lock = Lock()
+
+
+def executor(max_workers):
+    """Returns the process-wide pool, created on first use after the fork"""
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='fyyur-read')
+    return _executor
+
+
+def _run(app, call, replica):
+    with app.app_context():
+        # Read from the same replica as the request (see replicas.py)
+        g.replica = replica
+        try:
+            return call()
+        finally:
+            db.session.remove()
+
+
+def gather(*calls):
+    """Runs zero-argument callables, concurrently when PARALLEL_READS is on
+
+    The first call runs in the request's own thread and session, the
+    others on the pool.
+
+    Parameters
+    ----------
+    calls : callable
+        independent read-only functions; they must not rely on the request
+        or on objects loaded in the request's session
+
+    Returns
+    -------
+    results : list
+        the result of each call, in order
+    """
+
+    app = current_app._get_current_object()
+    if len(calls) < 2 or not app.config.get('PARALLEL_READS'):
+        return [call() for call in calls]
+
+    pool = executor(app.config['PARALLEL_READ_WORKERS'])
+    futures = [pool.submit(_run, app, call, g.get('replica')) for call in calls[1:]]
+
+    try:
+        first = calls[0]()
+    finally:
+        results = [future.result() for future in futures]
+
+    return [first] + results
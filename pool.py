@@ -0,0 +1,76 @@
+"""
+Fyyur pool.py - Connection pool with wait accounting
+
+QueuePool already reports its size, checked-in/out connections and
+overflow. InstrumentedQueuePool also counts checkouts that had to wait
+for a free connection and how long they waited, which is the number to
+watch when sizing workers against PostgreSQL's connection limit.
+"""
+
+import threading
+import time
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool counting checkouts that found the pool exhausted"""
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.stats_lock = threading.Lock()
+
+    def _do_get(self):
+        if self._pool.qsize() or self._max_overflow < 0 or self.overflow() < self._max_overflow:
+            return super(InstrumentedQueuePool, self)._do_get()
+
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        finally:
+            with self.stats_lock:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - started
+
+    def recreate(self):
+        pool = super(InstrumentedQueuePool, self).recreate()
+        pool.waits = self.waits
+        pool.wait_time = self.wait_time
+        return pool
+
+
+def pool_stats(engine):
+    """Returns the state of an engine's connection pool
+
+    Parameters
+    ----------
+    engine : Engine
+        engine whose pool is reported
+
+    Returns
+    -------
+    stats : dict
+        pool class and whichever of size, checked_in, checked_out,
+        overflow, waits and wait_ms the pool supports
+    """
+
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow
+        })
+
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({
+            'waits': pool.waits,
+            'wait_ms': round(pool.wait_time * 1000, 3)
+        })
+
+    return stats
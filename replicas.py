@@ -0,0 +1,176 @@
+"""
+Fyyur replicas.py - Read-replica routing for the database session
+
+Replica URLs from SQLALCHEMY_REPLICA_URIS become Flask-SQLAlchemy binds
+named replica_0, replica_1, ... At the start of a GET or HEAD request the
+router picks the next healthy replica, round-robin, and RoutingSession
+sends that request's reads to it. Everything else stays on the primary:
+other methods, flushes and Core INSERT/UPDATE/DELETE, sessions holding
+pending changes, and work outside a request (CLI commands, queue workers).
+
+A request that writes to the primary stamps the user's session cookie, and
+for REPLICA_STICKY_SECONDS afterwards that user's reads stay on the
+primary too, so they see their own writes despite replication lag.
+
+A replica whose connection fails is taken out of rotation and probed with
+SELECT 1 again after REPLICA_RETRY_SECONDS. Every engine counts the
+statements it runs, see stats().
+"""
+
+import threading
+import time
+from itertools import count
+from flask import g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm, text
+from sqlalchemy.sql.expression import UpdateBase
+from pool import pool_stats
+
+PRIMARY = 'primary'
+
+# Methods whose requests may read from a replica
+READ_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the request's replica when it has one"""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('replica') if has_app_context() else None
+
+        if replica is None or self._flushing or not self._is_clean() or \
+                isinstance(clause, UpdateBase):
+            return super(RoutingSession, self).get_bind(mapper, clause)
+        return self._db.get_engine(self.app, bind=replica)
+
+    @property
+    def _db(self):
+        return self.app.extensions['sqlalchemy'].db
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension whose sessions are RoutingSessions"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    """Round-robin over the replicas that answered their last check"""
+
+    def __init__(self, db, app):
+        self.db = db
+        self.app = app
+        self.names = sorted(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.retry_seconds = app.config['REPLICA_RETRY_SECONDS']
+        self.down_until = {}
+        self.queries = {}
+        self.lock = threading.Lock()
+        self._turn = count()
+
+        for name, engine in self.engines().items():
+            self._instrument(name, engine)
+
+    def engines(self):
+        """Maps each engine name (primary, replica_0, ...) to its engine"""
+
+        engines = {PRIMARY: self.db.get_engine(self.app)}
+        engines.update((name, self.db.get_engine(self.app, bind=name)) for name in self.names)
+        return engines
+
+    def _instrument(self, name, engine):
+        self.queries[name] = 0
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            with self.lock:
+                self.queries[name] += 1
+
+        if name == PRIMARY:
+            @event.listens_for(engine, 'after_cursor_execute')
+            def note_write(conn, cursor, statement, parameters, context, executemany):
+                if context is not None and (context.isinsert or context.isupdate or context.isdelete) \
+                        and has_request_context():
+                    g.wrote = True
+        else:
+            @event.listens_for(engine, 'handle_error')
+            def take_down(context):
+                if context.is_disconnect or context.connection is None:
+                    self.mark_down(name)
+
+    def mark_down(self, name):
+        with self.lock:
+            self.down_until[name] = time.monotonic() + self.retry_seconds
+        self.app.logger.warning('replica %s taken out of rotation', name)
+
+    def healthy(self, name):
+        """Whether a replica is in rotation, probing it once its retry time has passed"""
+
+        with self.lock:
+            down_until = self.down_until.get(name)
+            if down_until is None:
+                return True
+            if time.monotonic() < down_until:
+                return False
+            # One request probes, the others keep skipping the replica meanwhile
+            self.down_until[name] = time.monotonic() + self.retry_seconds
+
+        try:
+            with self.db.get_engine(self.app, bind=name).connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception:
+            self.mark_down(name)
+            return False
+
+        with self.lock:
+            self.down_until.pop(name, None)
+        return True
+
+    def choose(self):
+        """Returns the next healthy replica's name, None if there is none"""
+
+        for i in range(len(self.names)):
+            name = self.names[next(self._turn) % len(self.names)]
+            if self.healthy(name):
+                return name
+        return None
+
+    def stats(self):
+        """Returns each engine's statement count and whether it is in rotation"""
+
+        with self.lock:
+            return {name: {'queries': self.queries[name],
+                           'healthy': name == PRIMARY or name not in self.down_until}
+                    for name in self.queries}
+
+
+def init_app(app, db):
+    """Sets up the router and the request hooks that pick each request's engine"""
+
+    router = ReplicaRouter(db, app)
+    app.extensions['replicas'] = router
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.before_request
+    def route_reads():
+        g.replica = None
+        if router.names and request.method in READ_METHODS and \
+                time.time() - session.get('wrote_at', 0) >= sticky_seconds:
+            g.replica = router.choose()
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('wrote'):
+            session['wrote_at'] = time.time()
+        return response
+
+    return router
+
+
+def stats(app):
+    """Returns each engine's statement count, health and pool state"""
+
+    router = app.extensions['replicas']
+    engines = router.engines()
+    return {name: dict(engine_stats, **pool_stats(engines[name]))
+            for name, engine_stats in router.stats().items()}
@@ -0,0 +1,232 @@
+"""
+Fyyur scheduling.py - Show booking conflicts and venue availability
+
+A show occupies [start_time, start_time + duration_minutes). On PostgreSQL
+two exclusion constraints on that range reject overlapping shows at the
+same venue or for the same artist, whoever commits first. conflicts() runs
+the same check before the insert so the form can say what clashes, and is
+the only guard on databases without the constraints (SQLite in local runs).
+
+Candidate shows are read through the (venue_id, start_time) and
+(artist_id, start_time) indexes: a show that overlaps [start, end) must
+start before end and at most SHOW_MAX_MINUTES before start. The candidates
+are loaded into one IntervalTree per venue and artist, so checking many
+bookings at once costs one query plus a tree lookup per booking.
+overlapping_bookings() checks a batch of bookings against each other.
+"""
+
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from models import db, Show, SHOW_DEFAULT_MINUTES, SHOW_MAX_MINUTES
+
+# PostgreSQL SQLSTATE of exclusion constraint violations
+EXCLUSION_VIOLATION = '23P01'
+
+Booking = namedtuple('Booking', ['venue_id', 'artist_id', 'start_time', 'duration_minutes'])
+
+
+def end_time(start_time, duration_minutes):
+    return start_time + timedelta(minutes=duration_minutes or SHOW_DEFAULT_MINUTES)
+
+
+class IntervalTree:
+    """Static interval tree over half-open [start, end) intervals
+
+    Intervals are sorted by start and laid out as an implicit balanced
+    binary tree over that order, each node holding the largest end in its
+    subtree. overlapping() prunes subtrees that end before the query
+    starts and everything right of a node that starts after the query
+    ends, so a lookup costs O(log n + k).
+    """
+
+    def __init__(self, intervals):
+        """
+        Parameters
+        ----------
+        intervals : iterable (tuple)
+            (start, end, value) triples
+        """
+
+        self.intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.max_end = [None] * len(self.intervals)
+        self._build(0, len(self.intervals))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        ends = [self.intervals[mid][1], self._build(lo, mid), self._build(mid + 1, hi)]
+        self.max_end[mid] = max(end for end in ends if end is not None)
+        return self.max_end[mid]
+
+    def overlapping(self, start, end):
+        """Returns the values of every interval overlapping [start, end)"""
+
+        found = []
+        self._search(0, len(self.intervals), start, end, found)
+        return found
+
+    def _search(self, lo, hi, start, end, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            return
+
+        self._search(lo, mid, start, end, found)
+
+        interval_start, interval_end, value = self.intervals[mid]
+        if interval_start < end:
+            if interval_end > start:
+                found.append(value)
+            self._search(mid + 1, hi, start, end, found)
+
+    def __len__(self):
+        return len(self.intervals)
+
+
+def _existing_shows(bookings, exclude_ids=()):
+    """Loads the shows that could overlap any of the bookings"""
+
+    window_start = min(booking.start_time for booking in bookings) - timedelta(minutes=SHOW_MAX_MINUTES)
+    window_end = max(end_time(booking.start_time, booking.duration_minutes) for booking in bookings)
+
+    query = db.session.query(
+        Show.id,
+        Show.venue_id,
+        Show.artist_id,
+        Show.start_time,
+        Show.duration_minutes
+    ).filter(
+        or_(Show.venue_id.in_({booking.venue_id for booking in bookings}),
+            Show.artist_id.in_({booking.artist_id for booking in bookings})),
+        Show.start_time >= window_start,
+        Show.start_time < window_end
+    )
+
+    if exclude_ids:
+        query = query.filter(Show.id.notin_(list(exclude_ids)))
+
+    return query.all()
+
+
+def conflicts(bookings, exclude_ids=()):
+    """Finds existing shows overlapping any of the bookings
+
+    Parameters
+    ----------
+    bookings : list (Booking)
+        proposed shows
+    exclude_ids : iterable (int)
+        shows to ignore, e.g. the ones being moved
+
+    Returns
+    -------
+    clashes : list (tuple)
+        (index of the booking, 'venue' or 'artist', existing show row) for
+        every overlap found
+    """
+
+    if not bookings:
+        return []
+
+    trees = defaultdict(list)
+    for show in _existing_shows(bookings, exclude_ids):
+        interval = (show.start_time, end_time(show.start_time, show.duration_minutes), show)
+        trees['venue', show.venue_id].append(interval)
+        trees['artist', show.artist_id].append(interval)
+    trees = {key: IntervalTree(intervals) for key, intervals in trees.items()}
+
+    clashes = []
+    for index, booking in enumerate(bookings):
+        start, end = booking.start_time, end_time(booking.start_time, booking.duration_minutes)
+        for kind, owner_id in (('venue', booking.venue_id), ('artist', booking.artist_id)):
+            tree = trees.get((kind, owner_id))
+            if tree is not None:
+                clashes.extend((index, kind, show) for show in tree.overlapping(start, end))
+
+    return clashes
+
+
+def overlapping_bookings(bookings):
+    """Finds bookings that overlap each other at the same venue or artist
+
+    Returns
+    -------
+    clashes : list (tuple)
+        (index of the earlier booking, index of the later one, 'venue' or
+        'artist') for every booking that starts before an earlier one ends
+    """
+
+    owners = defaultdict(list)
+    for index, booking in enumerate(bookings):
+        owners['venue', booking.venue_id].append(index)
+        owners['artist', booking.artist_id].append(index)
+
+    clashes = []
+    for (kind, owner_id), indexes in owners.items():
+        indexes.sort(key=lambda index: bookings[index].start_time)
+        latest_end, latest = None, None
+
+        for index in indexes:
+            booking = bookings[index]
+            if latest_end is not None and booking.start_time < latest_end:
+                clashes.append((latest, index, kind))
+
+            end = end_time(booking.start_time, booking.duration_minutes)
+            if latest_end is None or end > latest_end:
+                latest_end, latest = end, index
+
+    return clashes
+
+
+def is_overlap_violation(error):
+    """Whether an IntegrityError came from the show exclusion constraints"""
+
+    return isinstance(error, IntegrityError) and \
+        getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+def free_slots(venue_id, start, end, min_minutes=0):
+    """Lists the free periods of a venue between start and end
+
+    Parameters
+    ----------
+    venue_id : int
+        venue to check
+    start : datetime
+        beginning of the range
+    end : datetime
+        end of the range
+    min_minutes : int
+        shortest free period returned
+
+    Returns
+    -------
+    slots : list (tuple)
+        (start, end) of each free period, in order
+    """
+
+    shows = db.session.query(Show.start_time, Show.duration_minutes). \
+        filter(Show.venue_id == venue_id,
+               Show.start_time >= start - timedelta(minutes=SHOW_MAX_MINUTES),
+               Show.start_time < end). \
+        order_by(Show.start_time). \
+        all()
+
+    slots = []
+    cursor = start
+    minimum = timedelta(minutes=min_minutes)
+
+    for show_start, duration in shows:
+        show_end = end_time(show_start, duration)
+        if show_start > cursor and show_start - cursor >= minimum:
+            slots.append((cursor, show_start))
+        cursor = max(cursor, show_end)
+
+    if end > cursor and end - cursor >= minimum:
+        slots.append((cursor, end))
+
+    return slots
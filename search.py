@@ -0,0 +1,197 @@
+"""
+Fyyur search.py - Ranked search over venues and artists
+
+On PostgreSQL the name, city, state and genres of each row are matched
+with a prefix tsquery against the GIN-indexed search_document() of the row
+(see models.py) and the trigram-indexed name ilike, then ranked by ts_rank
+plus pg_trgm similarity. Other databases (the SQLite test runs)
+use an in-process inverted index instead.
+"""
+
+import re
+from bisect import bisect_left
+from sqlalchemy import event, func, literal, or_
+from models import db, Venue, Artist
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Weight of a token match in each searchable field
+FIELD_WEIGHTS = {'name': 3, 'city': 2, 'state': 2, 'genres': 1}
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens
+
+    Parameters
+    ----------
+    text : String
+        text to split, may be None
+
+    Returns
+    -------
+    tokens : list (String)
+        lowercase tokens in order of appearance
+    """
+
+    if not text:
+        return []
+    return TOKEN.findall(text.lower())
+
+
+def ranked_search(model, term, page=1, per_page=20):
+    """Searches a Venue or Artist by name, city, state and genres
+
+    Parameters
+    ----------
+    model : Venue or Artist class
+        model to search
+    term : String
+        search term, every word must prefix-match some field
+    page : int
+        1-based page of results to return
+    per_page : int
+        maximum number of results per page
+
+    Returns
+    -------
+    results : dict
+        count (total matches), data (id and name of each match on the
+        page, best match first), page, per_page and has_next
+    """
+
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+
+    if db.engine.dialect.name == 'postgresql':
+        count, data = _postgres_search(model, term, offset, per_page)
+    else:
+        count, data = INDEXES[model].search(term, offset, per_page)
+
+    return {
+        "count": count,
+        "data": data,
+        "page": page,
+        "per_page": per_page,
+        "has_next": offset + len(data) < count
+    }
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _postgres_search(model, term, offset, limit):
+    tokens = tokenize(term)
+
+    query = db.session.query(model.id, model.name)
+
+    if tokens:
+        # Must stay the indexed expression, ix_venue/artist_search_document
+        document = func.search_document(model.name, model.city, model.state, model.genres)
+        ts_query = func.to_tsquery('simple', ' & '.join(token + ':*' for token in tokens))
+        rank = func.ts_rank(document, ts_query) + func.similarity(model.name, term)
+
+        query = query.filter(or_(
+            document.op('@@')(ts_query),
+            model.name.ilike('%' + _escape_like(term) + '%', escape='\\')
+        ))
+    else:
+        rank = literal(0)
+
+    rows = query.add_columns(func.count().over().label('total')). \
+        order_by(rank.desc(), model.name, model.id). \
+        offset(offset). \
+        limit(limit). \
+        all()
+
+    if rows:
+        count = rows[0].total
+    else:
+        count = query.count() if offset else 0
+
+    return count, [{'id': row.id, 'name': row.name} for row in rows]
+
+
+class InvertedIndex:
+    """In-process token index for one model, used when not on PostgreSQL
+
+    The postings are built from a single column query on first use and
+    dropped whenever a row of the model is inserted, updated or deleted.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.postings = None
+        self.tokens = []
+        self.names = {}
+
+        for action in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, action, self.invalidate)
+
+    def invalidate(self, *args):
+        self.postings = None
+
+    def build(self):
+        model = self.model
+        rows = db.session.query(model.id, model.name, model.city, model.state, model.genres).all()
+
+        postings = {}
+        names = {}
+
+        for row in rows:
+            names[row.id] = row.name or ''
+            for field, weight in FIELD_WEIGHTS.items():
+                value = getattr(row, field)
+                if field == 'genres':
+                    value = ' '.join(value or [])
+                for token in tokenize(value):
+                    entry = postings.setdefault(token, {})
+                    entry[row.id] = max(entry.get(row.id, 0), weight)
+
+        self.postings = postings
+        self.tokens = sorted(postings)
+        self.names = names
+
+    def _prefix_matches(self, prefix):
+        matched = {}
+        i = bisect_left(self.tokens, prefix)
+
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            for item_id, weight in self.postings[self.tokens[i]].items():
+                matched[item_id] = max(matched.get(item_id, 0), weight)
+            i += 1
+
+        return matched
+
+    def search(self, term, offset, limit):
+        if self.postings is None:
+            self.build()
+
+        tokens = tokenize(term)
+
+        if tokens:
+            scores = None
+            for token in tokens:
+                matched = self._prefix_matches(token)
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {item_id: scores[item_id] + weight
+                              for item_id, weight in matched.items() if item_id in scores}
+
+            # Keep the old partial name match working for mid-word terms
+            needle = term.strip().lower()
+            for item_id, name in self.names.items():
+                if needle in name.lower():
+                    scores[item_id] = scores.get(item_id, 0) + FIELD_WEIGHTS['name']
+        else:
+            scores = dict.fromkeys(self.names, 0)
+
+        ranked = sorted(scores.items(),
+                        key=lambda item: (-item[1], self.names[item[0]], item[0]))
+        page = ranked[offset:offset + limit]
+
+        return len(ranked), [{'id': item_id, 'name': self.names[item_id]} for item_id, score in page]
+
+
+INDEXES = {model: InvertedIndex(model) for model in (Venue, Artist)}
@@ -0,0 +1,227 @@
+"""
+Fyyur series.py - Recurring show series
+
+A series is expanded with a dateutil recurrence rule into ordinary Show
+rows, checked against existing shows and against itself in one pass
+(scheduling.conflicts() and overlapping_bookings()), then written with a
+single executemany insert. Editing a series replaces its upcoming shows,
+cancelling it deletes them; shows that already happened are kept either
+way. Venue and artist counters are recomputed once per write.
+"""
+
+from datetime import datetime
+from itertools import islice
+from dateutil import rrule
+from models import db, Venue, Artist, Show, ShowSeries, SHOW_DEFAULT_MINUTES
+from counters import recount_shows
+from formatting import format_datetime
+from scheduling import Booking, conflicts, overlapping_bookings
+
+FREQUENCIES = {
+    'daily': rrule.DAILY,
+    'weekly': rrule.WEEKLY,
+    'monthly': rrule.MONTHLY
+}
+
+
+# Conflicts reported back to the form at most
+MAX_MESSAGES = 10
+
+
+class SeriesError(Exception):
+    """A series could not be written, messages say why"""
+
+    def __init__(self, messages):
+        super().__init__('; '.join(messages))
+        self.messages = messages
+
+
+def expand(first_start, until, frequency, interval=1, after=None, limit=None):
+    """Lists the start times of a series
+
+    Parameters
+    ----------
+    first_start : datetime
+        start of the first show
+    until : datetime
+        no show starts after this
+    frequency : String
+        'daily', 'weekly' or 'monthly'
+    interval : int
+        days, weeks or months between shows
+    after : datetime
+        only list shows starting after this
+    limit : int
+        stop after this many shows
+
+    Returns
+    -------
+    starts : list (datetime)
+        start times, in order
+    """
+
+    rule = rrule.rrule(FREQUENCIES[frequency], dtstart=first_start, interval=interval, until=until)
+    return list(islice((start for start in rule if after is None or start > after), limit))
+
+
+def _check(series, starts, max_shows, exclude_ids=()):
+    if not starts:
+        raise SeriesError(['The series has no shows in that date range.'])
+    if len(starts) > max_shows:
+        raise SeriesError(['A series can have at most {} shows.'.format(max_shows)])
+
+    bookings = [Booking(series.venue_id, series.artist_id, start, series.duration_minutes)
+                for start in starts]
+
+    messages = ['The {} is already booked for show {} starting {}.'.format(
+        kind, show.id, format_datetime(show.start_time, 'medium'))
+        for index, kind, show in conflicts(bookings, exclude_ids)]
+    messages += ['Shows starting {} and {} overlap.'.format(
+        format_datetime(bookings[first].start_time, 'medium'),
+        format_datetime(bookings[second].start_time, 'medium'))
+        for first, second, kind in overlapping_bookings(bookings)[:1]]
+
+    if messages:
+        raise SeriesError(messages[:MAX_MESSAGES])
+
+
+def _insert_shows(series, starts):
+    mappings = [{
+        'venue_id': series.venue_id,
+        'artist_id': series.artist_id,
+        'start_time': start,
+        'duration_minutes': series.duration_minutes,
+        'series_id': series.id
+    } for start in starts]
+
+    db.session.execute(Show.__table__.insert(), mappings)
+
+
+def _delete_upcoming(series, now):
+    return db.session.execute(
+        Show.__table__.delete().
+        where(Show.series_id == series.id).
+        where(Show.start_time > now)
+    ).rowcount
+
+
+def _recount(series):
+    recount_shows([{'venue_id': series.venue_id, 'artist_id': series.artist_id}])
+
+
+def upcoming_ids(series, now):
+    return [row[0] for row in db.session.query(Show.id).
+            filter(Show.series_id == series.id, Show.start_time > now)]
+
+
+def create_series(venue_id, artist_id, first_start, until, frequency, interval=1,
+                  duration_minutes=None, max_shows=500):
+    """Creates a series and all of its shows in one transaction
+
+    Parameters
+    ----------
+    venue_id : int
+        venue the shows are at
+    artist_id : int
+        artist playing the shows
+    first_start : datetime
+        start of the first show
+    until : datetime
+        no show starts after this
+    frequency : String
+        'daily', 'weekly' or 'monthly'
+    interval : int
+        days, weeks or months between shows
+    duration_minutes : int
+        length of every show
+    max_shows : int
+        largest series accepted
+
+    Returns
+    -------
+    series : ShowSeries
+        the new series
+
+    Raises
+    ------
+    SeriesError :
+        unknown venue or artist, too many shows or booking conflicts
+    """
+
+    missing = []
+    if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+        missing.append('Venue {} does not exist.'.format(venue_id))
+    if db.session.query(Artist.id).filter(Artist.id == artist_id).scalar() is None:
+        missing.append('Artist {} does not exist.'.format(artist_id))
+    if missing:
+        raise SeriesError(missing)
+
+    series = ShowSeries(venue_id=venue_id, artist_id=artist_id, first_start=first_start,
+                        until=until, frequency=frequency, interval=interval,
+                        duration_minutes=duration_minutes or SHOW_DEFAULT_MINUTES)
+    starts = expand(first_start, until, frequency, interval, limit=max_shows + 1)
+    _check(series, starts, max_shows)
+
+    db.session.add(series)
+    db.session.flush()
+    _insert_shows(series, starts)
+    _recount(series)
+    db.session.commit()
+
+    return series
+
+
+def update_series(series, first_start, until, frequency, interval=1, duration_minutes=None,
+                  max_shows=500, now=None):
+    """Replaces the upcoming shows of a series with a new recurrence rule
+
+    Shows that already started are kept as they are.
+
+    Returns
+    -------
+    count : int
+        number of upcoming shows after the edit
+    """
+
+    now = now or datetime.now()
+    if series.cancelled_at is not None:
+        raise SeriesError(['The series was cancelled.'])
+
+    series.first_start = first_start
+    series.until = until
+    series.frequency = frequency
+    series.interval = interval
+    series.duration_minutes = duration_minutes or SHOW_DEFAULT_MINUTES
+
+    starts = expand(first_start, until, frequency, interval, after=now, limit=max_shows + 1)
+    try:
+        _check(series, starts, max_shows, exclude_ids=upcoming_ids(series, now))
+    except SeriesError:
+        db.session.rollback()
+        raise
+
+    _delete_upcoming(series, now)
+    _insert_shows(series, starts)
+    _recount(series)
+    db.session.commit()
+
+    return len(starts)
+
+
+def cancel_series(series, now=None):
+    """Deletes the upcoming shows of a series and marks it cancelled
+
+    Returns
+    -------
+    count : int
+        number of shows cancelled
+    """
+
+    now = now or datetime.now()
+
+    count = _delete_upcoming(series, now)
+    series.cancelled_at = now
+    _recount(series)
+    db.session.commit()
+
+    return count
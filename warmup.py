@@ -0,0 +1,81 @@
+"""
+Fyyur warmup.py - Template precompilation and worker warm-up
+
+Templates are compiled through Jinja's on-disk bytecode cache, so a cache
+built at deploy time ('flask precompile-templates') spares every new worker
+the compile step. warm() also opens the worker's pool connections up front,
+so the first requests do not pay for compiling or connecting.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from models import db
+
+
+def compile_templates(app):
+    """Loads every template, filling the bytecode cache
+
+    Returns
+    -------
+    count : int
+        number of templates compiled or loaded from the cache
+    """
+
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith('.html')]
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def warm_pool(app, connections=None):
+    """Opens pool connections concurrently and returns them to the pool
+
+    Parameters
+    ----------
+    app : Flask
+        application whose engine is warmed
+    connections : int
+        connections to open, defaults to the pool size
+
+    Returns
+    -------
+    count : int
+        number of connections opened
+    """
+
+    with app.app_context():
+        engine = db.engine
+        if connections is None:
+            size = getattr(engine.pool, 'size', None)
+            connections = size() if callable(size) else 1
+
+        def ping(i):
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                # hold the connection until every thread has one
+                time.sleep(0.05)
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(ping, range(connections)))
+
+    return connections
+
+
+def warm(app, connections=None):
+    """Compiles templates and fills the pool, timing each step in ms"""
+
+    started = time.perf_counter()
+    templates = compile_templates(app)
+    compiled = time.perf_counter()
+    pooled = warm_pool(app, connections)
+    finished = time.perf_counter()
+
+    return {
+        'templates': templates,
+        'templates_ms': round((compiled - started) * 1000, 1),
+        'connections': pooled,
+        'pool_ms': round((finished - compiled) * 1000, 1),
+        'total_ms': round((finished - started) * 1000, 1)
+    }
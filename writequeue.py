@@ -0,0 +1,406 @@
+"""
+Fyyur writequeue.py - Write-behind queue for form submissions
+
+With WRITE_BEHIND on, the create and edit forms do not commit to the
+database inside the request. The validated payload is appended to a queue
+table in a local SQLite file (WRITE_QUEUE_PATH, WAL journal, synchronous
+writes) and the submitter gets a token for /writes/<token>. A background
+thread in each web worker, or `flask drain-writes`, claims up to
+WRITE_QUEUE_BATCH_SIZE jobs at a time and applies them in one transaction:
+new venues and artists are added together, edits go through
+editing.stage_edit(), and all new shows are checked for conflicts in one
+pass and counted with one recount. If the batch raises, its jobs are
+retried one per transaction, and a job that raises again, whether from the
+database or from a bad payload, is marked failed with the error, so it
+neither stops the drain nor comes back.
+
+Enqueueing raises QueueFull once WRITE_QUEUE_MAX_DEPTH jobs are waiting, and
+the routes answer 503 with Retry-After. Jobs claimed by a worker that died
+are queued again after WRITE_QUEUE_STALE_SECONDS.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from uuid import uuid4
+import dateutil.parser
+from models import db, Venue, Artist, Show
+from cache import cache
+from counters import recount_shows
+from editing import EditConflict, stage_edit
+from formatting import format_datetime
+from scheduling import Booking, conflicts, overlapping_bookings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    result TEXT,
+    queued_at REAL NOT NULL,
+    claimed_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_job_status_id ON job (status, id);
+"""
+
+MODELS = {'venue': Venue, 'artist': Artist}
+
+
+class QueueFull(Exception):
+    """Too many submissions are waiting, the client should retry later"""
+
+
+class WriteQueue:
+    """Durable FIFO of write jobs in a SQLite file, shared by the workers of a host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        if not self._ready:
+            connection.executescript(SCHEMA)
+            self._ready = True
+        return connection
+
+    def depth(self, connection):
+        return connection.execute(
+            "SELECT count(*) FROM job WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def enqueue(self, kind, payload, max_depth):
+        """Appends a job and returns its token
+
+        Raises
+        ------
+        QueueFull :
+            max_depth jobs are already waiting
+        """
+
+        token = uuid4().hex
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            if self.depth(connection) >= max_depth:
+                raise QueueFull()
+            connection.execute('INSERT INTO job (token, kind, payload, queued_at) VALUES (?, ?, ?, ?)',
+                               (token, kind, json.dumps(payload), time.time()))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+        return token
+
+    def claim(self, limit, stale_seconds):
+        """Marks up to limit queued jobs running and returns them, oldest first"""
+
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute("UPDATE job SET status = 'queued', claimed_at = NULL "
+                               "WHERE status = 'running' AND claimed_at < ?", (now - stale_seconds,))
+            jobs = connection.execute("SELECT id, token, kind, payload FROM job WHERE status = 'queued' "
+                                      "ORDER BY id LIMIT ?", (limit,)).fetchall()
+            connection.executemany("UPDATE job SET status = 'running', claimed_at = ? WHERE id = ?",
+                                   [(now, job['id']) for job in jobs])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+        return [{'id': job['id'], 'token': job['token'], 'kind': job['kind'],
+                 'payload': json.loads(job['payload'])} for job in jobs]
+
+    def finish(self, results):
+        """Stores (status, result) for each job id"""
+
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany("UPDATE job SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                                   [(status, json.dumps(result), now, job_id)
+                                    for job_id, (status, result) in results.items()])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def status(self, token):
+        """Returns the state of a job as a dict, None for an unknown token"""
+
+        connection = self.connect()
+        try:
+            job = connection.execute('SELECT id, kind, status, result FROM job WHERE token = ?',
+                                     (token,)).fetchone()
+            if job is None:
+                return None
+
+            status = {'token': token, 'kind': job['kind'], 'status': job['status'],
+                      'result': json.loads(job['result']) if job['result'] else None}
+            if job['status'] == 'queued':
+                status['ahead'] = connection.execute(
+                    "SELECT count(*) FROM job WHERE status = 'queued' AND id < ?", (job['id'],)).fetchone()[0]
+            return status
+        finally:
+            connection.close()
+
+    def prune(self, older_than):
+        """Deletes finished jobs older than older_than seconds"""
+
+        connection = self.connect()
+        try:
+            connection.execute("DELETE FROM job WHERE status IN ('done', 'failed') AND finished_at < ?",
+                               (time.time() - older_than,))
+        finally:
+            connection.close()
+
+
+_queues = {}
+
+
+def queue(app):
+    """Returns the app's queue"""
+
+    path = app.config['WRITE_QUEUE_PATH']
+    if path not in _queues:
+        _queues[path] = WriteQueue(path)
+    return _queues[path]
+
+
+def submit(app, kind, payload):
+    """Queues a write and makes sure this process drains the queue
+
+    Parameters
+    ----------
+    app : Flask
+        application, for its settings
+    kind : String
+        'venue.create', 'artist.create', 'venue.edit', 'artist.edit' or 'show.create'
+    payload : dict
+        JSON-serializable job data
+
+    Returns
+    -------
+    token : String
+        key for status()
+
+    Raises
+    ------
+    QueueFull :
+        WRITE_QUEUE_MAX_DEPTH jobs are already waiting
+    """
+
+    token = queue(app).enqueue(kind, payload, app.config['WRITE_QUEUE_MAX_DEPTH'])
+    start_worker(app)
+    return token
+
+
+# ----------------------------------------------------------------------------#
+# Applying jobs.
+# ----------------------------------------------------------------------------#
+
+
+def _create(job, groups):
+    model = MODELS[job['kind'].split('.')[0]]
+    values = dict(job['payload'])
+    location = values.pop('latitude', None), values.pop('longitude', None)
+
+    entity = model(**values)
+    if model is Venue:
+        entity.latitude, entity.longitude = location
+    db.session.add(entity)
+    db.session.flush()
+
+    groups.update([model.__tablename__ + 's'])
+    return 'done', {'id': entity.id}
+
+
+def _edit(job, groups):
+    model = MODELS[job['kind'].split('.')[0]]
+    payload = job['payload']
+
+    try:
+        entity, changed = stage_edit(model, payload['id'], payload['version'], payload['values'])
+    except EditConflict as conflict:
+        return 'failed', {'conflict': sorted(conflict.differences)}
+
+    if entity is None:
+        return 'failed', {'messages': ['{} {} does not exist.'.format(model.__name__, payload['id'])]}
+
+    if changed:
+        # Flush now so a later edit of the same row in the batch checks the new version
+        db.session.flush()
+        groups.update(entity.cache_groups())
+    return 'done', {'id': entity.id, 'changed': changed}
+
+
+def _create_shows(jobs, groups):
+    results = {}
+    bookings = [Booking(job['payload']['venue_id'], job['payload']['artist_id'],
+                        dateutil.parser.parse(job['payload']['start_time']),
+                        job['payload']['duration_minutes']) for job in jobs]
+
+    known = {('venue', row[0]) for row in db.session.query(Venue.id).
+             filter(Venue.id.in_({booking.venue_id for booking in bookings}))}
+    known |= {('artist', row[0]) for row in db.session.query(Artist.id).
+              filter(Artist.id.in_({booking.artist_id for booking in bookings}))}
+
+    messages = {}
+    for index, booking in enumerate(bookings):
+        for kind, owner_id in (('venue', booking.venue_id), ('artist', booking.artist_id)):
+            if (kind, owner_id) not in known:
+                messages.setdefault(index, []).append('{} {} does not exist.'.format(kind.title(), owner_id))
+    for index, kind, show in conflicts(bookings):
+        messages.setdefault(index, []).append('The {} is already booked for show {} starting {}.'.format(
+            kind, show.id, format_datetime(show.start_time, 'medium')))
+    for first, second, kind in overlapping_bookings(bookings):
+        # The later submission loses
+        later = max(first, second)
+        messages.setdefault(later, []).append('The {} was booked by another submission.'.format(kind))
+
+    shows = []
+    for index, (job, booking) in enumerate(zip(jobs, bookings)):
+        if index in messages:
+            results[job['id']] = ('failed', {'messages': messages[index]})
+            continue
+        show = Show(venue_id=booking.venue_id, artist_id=booking.artist_id, start_time=booking.start_time)
+        show.duration_minutes = booking.duration_minutes
+        shows.append((job, show))
+
+    if shows:
+        db.session.add_all([show for job, show in shows])
+        db.session.flush()
+        recount_shows([{'venue_id': show.venue_id, 'artist_id': show.artist_id} for job, show in shows])
+        groups.update(['shows', 'venues', 'artists'])
+        for job, show in shows:
+            groups.update(['venue:%d' % show.venue_id, 'artist:%d' % show.artist_id])
+            results[job['id']] = ('done', {'id': show.id})
+
+    return results
+
+
+HANDLERS = {
+    'venue.create': _create,
+    'artist.create': _create,
+    'venue.edit': _edit,
+    'artist.edit': _edit
+}
+
+
+def apply_jobs(jobs):
+    """Applies jobs in one transaction and commits
+
+    Returns
+    -------
+    results : dict
+        job id -> (status, result)
+
+    Raises
+    ------
+    Exception :
+        any error of a handler or the commit, nothing was committed
+    """
+
+    results = {}
+    groups = set()
+
+    for job in jobs:
+        if job['kind'] in HANDLERS:
+            results[job['id']] = HANDLERS[job['kind']](job, groups)
+
+    show_jobs = [job for job in jobs if job['kind'] == 'show.create']
+    if show_jobs:
+        results.update(_create_shows(show_jobs, groups))
+
+    db.session.commit()
+
+    if groups:
+        cache.invalidate(*groups)
+    return results
+
+
+def drain_once(app):
+    """Claims one batch and applies it
+
+    Returns
+    -------
+    count : int
+        number of jobs processed, 0 if the queue was empty
+    """
+
+    write_queue = queue(app)
+    jobs = write_queue.claim(app.config['WRITE_QUEUE_BATCH_SIZE'], app.config['WRITE_QUEUE_STALE_SECONDS'])
+    if not jobs:
+        return 0
+
+    try:
+        results = apply_jobs(jobs)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning('write batch of %d failed, retrying one by one: %s', len(jobs), e)
+        results = {}
+        for job in jobs:
+            try:
+                results.update(apply_jobs([job]))
+            except Exception as e:
+                # Failed for good, a job left running would be requeued and fail forever
+                db.session.rollback()
+                results[job['id']] = ('failed', {'messages': ['The change could not be saved.'],
+                                                 'error': '{}: {}'.format(type(e).__name__, e)})
+                app.logger.exception('write job %s failed', job['token'])
+
+    write_queue.finish(results)
+    return len(jobs)
+
+
+def drain(app, stop=None):
+    """Drains the queue until stop is set, sleeping when it is empty"""
+
+    last_prune = 0
+    while stop is None or not stop.is_set():
+        try:
+            with app.app_context():
+                processed = drain_once(app)
+                db.session.remove()
+        except Exception:
+            app.logger.exception('write-behind worker error')
+            processed = 0
+
+        if not processed:
+            if time.time() - last_prune > 3600:
+                queue(app).prune(app.config['WRITE_QUEUE_KEEP_HOURS'] * 3600)
+                last_prune = time.time()
+            time.sleep(app.config['WRITE_QUEUE_POLL_SECONDS'])
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(app):
+    """Starts the draining thread of this process unless it is running"""
+
+    global _worker
+    with _worker_lock:
+        # Threads do not survive a fork, a forked worker starts its own
+        if _worker is not None and _worker.is_alive() and _worker.pid == os.getpid():
+            return
+        _worker = threading.Thread(target=drain, args=(app,), name='fyyur-write-behind', daemon=True)
+        _worker.pid = os.getpid()
+        _worker.start()
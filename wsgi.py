@@ -0,0 +1,14 @@
+"""
+Fyyur wsgi.py - Production WSGI entry point
+
+    FYYUR_ENV=production gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+import os
+import time
+
+os.environ.setdefault('FYYUR_ENV', 'production')
+
+started = time.perf_counter()
+from app import app as application  # noqa: E402
+IMPORT_MS = round((time.perf_counter() - started) * 1000, 1)